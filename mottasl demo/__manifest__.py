@@ -9,7 +9,11 @@
     'license': 'LGPL-3',
     'auto_install':False,
     'data': [
+        'security/ir.model.access.csv',
+        'data/ir_cron.xml',
         'views/res.xml',
+        'views/mottasl_event_views.xml',
+        'views/mottasl_backfill_views.xml',
+        'wizard/mottasl_event_replay_views.xml',
     ],
-    'post_init_hook': 'post_init_hook',
 }
@@ -0,0 +1,168 @@
+"""Throughput benchmark of the Mottasl event pipeline against a local stub.
+
+Measures create, write and unlink of invoices, sale orders and leads, and
+the time needed to drain the resulting events to a local stand-in of the
+Mottasl endpoint (see ``stub_server.py``), in each delivery mode:
+
+``disabled``
+    no API key, the module adds no work to the ORM calls
+``single``
+    one request per event
+``batch``
+    batch envelopes
+
+Run it on a throwaway database with the module installed and no Odoo
+server running on it, the benchmark commits its records::
+
+    python benchmarks/bench_events.py -c odoo.conf -d bench \\
+        --sizes 1 100 10000 --latency 20 --output bench.json
+
+Each figure is the median of ``--repeat`` runs, in seconds. Failed requests
+(``--error-rate``) are retried right away, without backoff nor circuit
+breaker pause, so that the drain times measure throughput and not delays.
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+
+import odoo
+from odoo import SUPERUSER_ID, api
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+import stub_server  # noqa: E402
+
+MODES = ('disabled', 'single', 'batch')
+MODELS = ('account.move', 'sale.order', 'crm.lead')
+PARAMS = (
+    'mottasl_api_key', 'mottasl.endpoint_url', 'mottasl.batch_enabled',
+    'mottasl.batch_max_events', 'mottasl.batch_max_age',
+    'mottasl.retry_base_delay', 'mottasl.retry_max_delay', 'mottasl.breaker_reset_timeout',
+)
+
+
+def prepare_vals(env, model, partner, size):
+    if model == 'account.move':
+        return [{
+            'move_type': 'out_invoice',
+            'partner_id': partner.id,
+            'invoice_line_ids': [(0, 0, {'name': f'Benchmark {i}', 'quantity': 1, 'price_unit': 10})],
+        } for i in range(size)]
+    if model == 'sale.order':
+        return [{'partner_id': partner.id} for _i in range(size)]
+    return [{'name': f'Benchmark {i}', 'partner_id': partner.id} for i in range(size)]
+
+
+def write_vals(model, run):
+    if model == 'account.move':
+        return {'ref': f'benchmark-{run}'}
+    if model == 'sale.order':
+        return {'client_order_ref': f'benchmark-{run}'}
+    return {'expected_revenue': run}
+
+
+def configure(env, mode, url, batch_size):
+    set_param = env['ir.config_parameter'].set_param
+    set_param('mottasl_api_key', mode != 'disabled' and 'benchmark')
+    set_param('mottasl.endpoint_url', url)
+    set_param('mottasl.batch_enabled', mode == 'batch')
+    set_param('mottasl.batch_max_events', batch_size)
+    set_param('mottasl.batch_max_age', 0)
+    set_param('mottasl.retry_base_delay', 0)
+    set_param('mottasl.retry_max_delay', 0)
+    set_param('mottasl.breaker_reset_timeout', 0)
+    env.cr.commit()
+
+
+def drain(env, timeout):
+    """Dispatch until the outbox is empty, return the time it took."""
+    Event = env['mottasl.event']
+    start = time.perf_counter()
+    while Event.search_count([('state', '=', 'pending')]):
+        if time.perf_counter() - start > timeout:
+            print(f"  drain timed out, {Event.search_count([('state', '=', 'pending')])} events left")
+            break
+        Event._cron_dispatch()
+        env.invalidate_all()
+    return time.perf_counter() - start
+
+
+def timed(env, func):
+    start = time.perf_counter()
+    result = func()
+    env.cr.commit()  # the events are written by the commit
+    return time.perf_counter() - start, result
+
+
+def run_once(env, model, mode, size, run, args):
+    partner = env.ref('base.partner_admin')
+    env['mottasl.event'].search([('state', '=', 'done')]).unlink()
+    env.cr.commit()
+    vals_list = prepare_vals(env, model, partner, size)
+    timings = {}
+    create, records = timed(env, lambda: env[model].create(vals_list))
+    timings['create'], timings['create_drain'] = create, drain(env, args.drain_timeout)
+    timings['write'], _result = timed(env, lambda: records.write(write_vals(model, run)))
+    timings['write_drain'] = drain(env, args.drain_timeout)
+    timings['unlink'], _result = timed(env, records.unlink)
+    timings['unlink_drain'] = drain(env, args.drain_timeout)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('-c', '--config', required=True, help='Odoo configuration file')
+    parser.add_argument('-d', '--database', required=True)
+    parser.add_argument('--models', nargs='+', default=MODELS)
+    parser.add_argument('--modes', nargs='+', default=MODES, choices=MODES)
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1, 100, 10000])
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0, help='stub latency in milliseconds')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of failed stub requests')
+    parser.add_argument('--drain-timeout', type=float, default=600)
+    parser.add_argument('--output', help='write the results to this JSON file')
+    args = parser.parse_args()
+
+    odoo.tools.config.parse_config(['-c', args.config, '-d', args.database])
+    server = stub_server.start(latency=args.latency / 1000, error_rate=args.error_rate)
+    url = f'http://127.0.0.1:{server.server_address[1]}/odoo-events'
+    results = []
+    registry = odoo.modules.registry.Registry(args.database)
+    with registry.cursor() as cr:
+        env = api.Environment(cr, SUPERUSER_ID, {})
+        saved = {key: env['ir.config_parameter'].get_param(key) for key in PARAMS}
+        try:
+            print(f"{'model':<14}{'mode':<10}{'size':>7}  {'create':>9}{'drain':>9}"
+                  f"{'write':>9}{'drain':>9}{'unlink':>9}{'drain':>9}{'requests':>10}")
+            for model in args.models:
+                if model not in env:
+                    print(f'{model}: not installed, skipped')
+                    continue
+                for size in args.sizes:
+                    for mode in args.modes:
+                        configure(env, mode, url, args.batch_size)
+                        server.RequestHandlerClass.state.reset()
+                        runs = [run_once(env, model, mode, size, run, args) for run in range(args.repeat)]
+                        timings = {key: statistics.median(run[key] for run in runs) for key in runs[0]}
+                        stats = server.RequestHandlerClass.state.stats()
+                        requests = stats['requests'] // args.repeat
+                        results.append({'model': model, 'mode': mode, 'size': size, 'requests': requests, **timings})
+                        print(f"{model:<14}{mode:<10}{size:>7}  {timings['create']:>9.3f}{timings['create_drain']:>9.3f}"
+                              f"{timings['write']:>9.3f}{timings['write_drain']:>9.3f}"
+                              f"{timings['unlink']:>9.3f}{timings['unlink_drain']:>9.3f}{requests:>10}")
+        finally:
+            for key, value in saved.items():
+                env['ir.config_parameter'].set_param(key, value or False)
+            cr.commit()
+            server.shutdown()
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'latency_ms': args.latency, 'error_rate': args.error_rate, 'results': results}, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
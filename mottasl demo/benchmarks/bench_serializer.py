@@ -0,0 +1,91 @@
+"""Micro-benchmark of the event serializer against the former DateTimeEncoder.
+
+Runs without Odoo on the sample payloads shipped in ``models/``::
+
+    python benchmarks/bench_serializer.py [--number 2000] [--batch 500]
+
+Date and datetime strings of the samples are turned back into Python
+objects first, so both encoders see what ``record.read()`` returns.
+"""
+import argparse
+import importlib.util
+import json
+import os
+import re
+import timeit
+from datetime import date, datetime
+
+ADDON_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SAMPLES = ('order.json', 'crm.leads.json', 'invoice.json')
+
+DATE_RE = re.compile(r'^\d{4}-\d{2}-\d{2}$')
+DATETIME_RE = re.compile(r'^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(\.\d+)?$')
+
+
+def load_serializer():
+    # load the module by path, the addon directory is not an importable package here
+    spec = importlib.util.spec_from_file_location(
+        'mottasl_serializer', os.path.join(ADDON_DIR, 'tools', 'serializer.py'))
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module
+
+
+class DateTimeEncoder(json.JSONEncoder):
+    """The encoder formerly copied in invoices.py, sales_orders.py and crm_leads.py."""
+    def default(self, obj):
+        if isinstance(obj, date):
+            return obj.isoformat()
+        return super(DateTimeEncoder, self).default(obj)
+
+
+def load_sample(name):
+    """Return the sample as read() would, and the names of its date fields."""
+    with open(os.path.join(ADDON_DIR, 'models', name)) as f:
+        row = json.load(f)
+    date_fields = []
+    for key, value in row.items():
+        if isinstance(value, str) and DATE_RE.match(value):
+            row[key] = date.fromisoformat(value)
+            date_fields.append(key)
+        elif isinstance(value, str) and DATETIME_RE.match(value):
+            row[key] = datetime.fromisoformat(value)
+            date_fields.append(key)
+    return row, date_fields
+
+
+def bench(label, func, number):
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    print(f'  {label:<34} {seconds / number * 1e6:10.1f} us/op')
+    return seconds
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--number', type=int, default=2000, help='operations per measurement')
+    parser.add_argument('--batch', type=int, default=500, help='events per batch envelope')
+    args = parser.parse_args()
+    serializer = load_serializer()
+
+    for name in SAMPLES:
+        row, date_fields = load_sample(name)
+        size = len(serializer.dumps(row).encode())
+        print(f'{name}: {len(row)} fields, {len(date_fields)} date fields, {size} bytes')
+
+        old = bench('DateTimeEncoder', lambda: json.dumps({'data': row}, cls=DateTimeEncoder), args.number)
+        new = bench('serializer.dumps', lambda: serializer.dumps({'data': row}), args.number)
+        print(f'  speedup: {old / new:.2f}x')
+
+        payloads = [serializer.dumps({'data': row})] * args.batch
+        envelope = {'business_id': 'benchmark', 'event': 'batch'}
+        number = max(args.number // args.batch, 10)
+        bench(f'batch of {args.batch}, decode + dumps', lambda: json.dumps(
+            dict(envelope, events=[json.loads(payload) for payload in payloads])), number)
+        bench(f'batch of {args.batch}, spliced', lambda: b''.join(
+            serializer.iterencode_batch(envelope, payloads)), number)
+        bench(f'batch of {args.batch}, spliced + gzip', lambda: b''.join(
+            serializer.gzip_chunks(serializer.iterencode_batch(envelope, payloads))), number)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Local stand-in for the Mottasl ``/odoo-events`` endpoint.
+
+Accepts single events and batch envelopes, optionally gzipped, after an
+artificial latency, and fails a configurable share of the requests::
+
+    python benchmarks/stub_server.py --port 8099 --latency 50 --error-rate 0.01
+
+``GET /stats`` returns the number of requests, events and errors served so
+far as JSON, ``POST /reset`` clears them.
+"""
+import argparse
+import gzip
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubState:
+
+    def __init__(self, latency=0.0, error_rate=0.0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self.lock:
+            self.requests = 0
+            self.events = 0
+            self.errors = 0
+            self.bytes = 0
+
+    def stats(self):
+        with self.lock:
+            return {'requests': self.requests, 'events': self.events, 'errors': self.errors, 'bytes': self.bytes}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'  # keep-alive, like the real endpoint
+    state = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def _reply(self, status, body):
+        data = json.dumps(body).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def do_GET(self):
+        if self.path == '/stats':
+            self._reply(200, self.state.stats())
+        else:
+            self._reply(404, {'error': 'not found'})
+
+    def do_POST(self):
+        body = self.rfile.read(int(self.headers.get('Content-Length', 0)))
+        if self.path == '/reset':
+            self.state.reset()
+            return self._reply(200, {})
+        if not self.path.startswith('/odoo-events'):
+            return self._reply(404, {'error': 'not found'})
+        if self.state.latency:
+            time.sleep(self.state.latency)
+        size = len(body)
+        if self.headers.get('Content-Encoding') == 'gzip':
+            body = gzip.decompress(body)
+        try:
+            payload = json.loads(body)
+        except ValueError:
+            return self._reply(400, {'error': 'malformed payload'})
+        failed = random.random() < self.state.error_rate
+        with self.state.lock:
+            self.state.requests += 1
+            self.state.bytes += size
+            if failed:
+                self.state.errors += 1
+            else:
+                self.state.events += len(payload.get('events', ())) or 1
+        if failed:
+            return self._reply(503, {'error': 'injected failure'})
+        self._reply(200, {'status': 'ok'})
+
+
+def start(port=0, latency=0.0, error_rate=0.0):
+    """Start the stub in a daemon thread and return the server, its port is
+    ``server.server_address[1]``."""
+    handler = type('Handler', (StubHandler,), {'state': StubState(latency, error_rate)})
+    server = ThreadingHTTPServer(('127.0.0.1', port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--latency', type=float, default=0, help='milliseconds added to each request')
+    parser.add_argument('--error-rate', type=float, default=0, help='share of requests answered with a 503')
+    args = parser.parse_args()
+    server = start(args.port, args.latency / 1000, args.error_rate)
+    print(f'Mottasl stub listening on http://127.0.0.1:{server.server_address[1]}/odoo-events')
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,74 @@
+import hmac
+
+import psycopg2
+
+from odoo import http
+from odoo.http import request
+
+from ..models.mottasl_invoice_pdf import PDF_CACHE_MAX_AGE, PDF_RENDER_RETRY_AFTER
+from ..tools import metrics
+
+
+class MottaslController(http.Controller):
+
+    @http.route('/mottasl/metrics', type='http', auth='public', methods=['GET'], csrf=False, save_session=False)
+    def metrics(self, token=None, **kwargs):
+        """Expose the event pipeline metrics of all the worker processes in
+        the Prometheus text format. Requires the ``mottasl.metrics_token`` system
+        parameter, passed as ``?token=`` or as a bearer token."""
+        expected = request.env['ir.config_parameter'].sudo().get_param('mottasl.metrics_token')
+        authorization = request.httprequest.headers.get('Authorization', '')
+        if authorization.startswith('Bearer '):
+            token = authorization[len('Bearer '):]
+        if not expected or not token or not hmac.compare_digest(token, expected):
+            return request.make_response('Forbidden', status=403, headers=[('Content-Type', 'text/plain')])
+        Metric = request.env['mottasl.metric'].sudo()
+        Metric._flush()
+        gauges = request.env['mottasl.event'].sudo()._get_metrics_gauges()
+        return request.make_response(
+            metrics.render(Metric._get_samples(), gauges),
+            headers=[('Content-Type', 'text/plain; version=0.0.4; charset=utf-8'), ('Cache-Control', 'no-store')],
+        )
+
+    @http.route('/mottasl/invoice/<int:invoice_id>/<string:token>', type='http', auth='public', methods=['GET'],
+                save_session=False)
+    def invoice_pdf(self, invoice_id, token, **kwargs):
+        """Serve the cached PDF of an invoice linked from a Mottasl event,
+        rendering it first if the invoice changed since. Responses carry an
+        ETag and may be cached for a few minutes, so repeated clicks on a
+        campaign link are answered without a render. While a request renders
+        the PDF, concurrent clicks get the previous one, or are asked to come
+        back if there is none yet."""
+        InvoicePdf = request.env['mottasl.invoice.pdf'].sudo()
+        entry = InvoicePdf.search([('move_id', '=', invoice_id)], limit=1)
+        if not entry:
+            # link of a backfilled invoice, clicked for the first time
+            if not hmac.compare_digest(InvoicePdf._get_token(invoice_id), token):
+                raise request.not_found()
+            if not request.env['account.move'].sudo().browse(invoice_id).exists():
+                raise request.not_found()
+            try:
+                with request.env.cr.savepoint():
+                    entry = InvoicePdf.create({'move_id': invoice_id, 'token': token})
+            except psycopg2.IntegrityError:
+                # created by a concurrent click, which renders the PDF
+                return _pdf_retry_later()
+        if not hmac.compare_digest(entry.token, token):
+            raise request.not_found()
+        if not entry._is_fresh():
+            if entry._lock_for_render():
+                entry._render()
+            elif not entry.with_context(bin_size=True).pdf:
+                return _pdf_retry_later()
+        filename = f"{entry.move_id._get_report_base_filename()}.pdf"
+        stream = request.env['ir.binary']._get_stream_from(entry, 'pdf', filename=filename, mimetype='application/pdf')
+        stream.public = True
+        stream.max_age = PDF_CACHE_MAX_AGE
+        return stream.get_response()
+
+
+def _pdf_retry_later():
+    return request.make_response(
+        'The invoice PDF is being generated, please retry shortly.', status=503,
+        headers=[('Content-Type', 'text/plain'), ('Retry-After', str(PDF_RENDER_RETRY_AFTER))],
+    )
@@ -1,125 +1,121 @@
-import json
 import logging
-from datetime import date, datetime
-
-import requests
 
 from odoo import models, api
 
 _logger = logging.getLogger(__name__)
 
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, date):
-            return obj.isoformat()
-        return super(DateTimeEncoder, self).default(obj)
-
-
 class CrmLead(models.Model):
-    _inherit = 'crm.lead'
+    _inherit = ['crm.lead', 'mottasl.event.mixin']
 
-    @api.model
-    def _get_api_key(self):
-        api_config = self.env['api.configuration'].search([], limit=1)
-        return api_config.api_key if api_config else None
+    _mottasl_fields = (
+        'name', 'type', 'stage_id', 'partner_id', 'contact_name', 'partner_name',
+        'email_from', 'phone', 'mobile', 'user_id', 'team_id', 'company_id',
+        'expected_revenue', 'probability', 'priority', 'date_deadline',
+        'create_date', 'write_date',
+    )
+    _mottasl_backfill_event = 'CRM Lead Created'
 
     @api.model_create_multi
     def create(self, vals_list):
-        _logger.info("Creating new leads with values: %s", vals_list)
+        if self._mottasl_is_bulk(len(vals_list)):
+            _logger.info("Creating %s leads in bulk import mode", len(vals_list))
+        elif self._mottasl_log_sample(_logger):
+            _logger.debug("Creating new leads with values: %s", vals_list)
         records = super(CrmLead, self).create(vals_list)
-        self._send_lead_data(records, event='CRM Lead Created')
+        records._mottasl_collect('create', 'CRM Lead Created')
         return records
 
     def write(self, vals):
-        _logger.info("Updating leads with values: %s", vals)
+        if self._mottasl_log_sample(_logger):
+            _logger.debug("Updating leads %s with values: %s", self.ids, vals)
+        snapshot = self._mottasl_snapshot(vals)  # Projected data before the write, None if irrelevant
         result = super(CrmLead, self).write(vals)
-        self._send_lead_data(self, event='CRM Lead Updated')
+        if snapshot is not None:
+            self._mottasl_collect('update', 'CRM Lead Updated', snapshot)
         return result
 
     def unlink(self):
-        _logger.info("Deleting leads with ids: %s", self.ids)
-        records = self.read(['id', 'name', 'partner_id'])  # Read necessary data before deletion
+        _logger.info("Deleting %s leads", len(self))
+        _logger.debug("Deleting leads with ids: %s", self.ids)
+        delete_data = self._mottasl_read_delete_data('CRM Lead Deleted')  # Snapshot before deletion
         result = super(CrmLead, self).unlink()
-        self._send_delete_action(records)
+        if delete_data:
+            self._mottasl_collect('delete', 'CRM Lead Deleted', delete_data)
         return result
 
     def _send_delete_action(self, records):
-        param_obj = self.env['ir.config_parameter']
-        mottasl_api_key = param_obj.get_param('mottasl_api_key')
-
-        if not mottasl_api_key:
+        config = self.env['mottasl.event']._get_config()
+        if not config:
             _logger.error("API Key not configured. Unable to send delete action.")
             return
 
+        Event = self.env['mottasl.event']
+        events = []
         for record in records:
-            partner = self.env['res.partner'].browse(record['partner_id'][0])
-            customer_phone = partner.phone or partner.mobile or 'N/A'
-
-            url = f'https://clients.twerlo.com/odoo-events?api_key={mottasl_api_key}'
-
+            destination = Event._get_destination(record['company_id'])
+            if not destination:
+                _logger.warning("No Mottasl API key for the company of %s %s, delete not sent", self._name, record['id'])
+                continue
             delete_data = {
               "data": {'id': record['id'],
-                'customer_phone': customer_phone,
-                'deletion_date': datetime.now().isoformat(),},
-                'business_id':mottasl_api_key,
+                'customer_phone': record['customer_phone'],
+                'deletion_date': record['deletion_date'],},
+                'business_id': destination.api_key,
                 'event': 'CRM Lead Deleted',
             }
-
-            _logger.info("Sending delete action data to endpoint: %s", url)
-            try:
-                json_data = json.dumps(delete_data, cls=DateTimeEncoder)
-                response = requests.post(
-                    url,
-                    data=json_data,
-                    headers={'Content-Type': 'application/json'},
-                    timeout=60  # Increase the timeout to 60 seconds
-                )
-                response.raise_for_status()
-                _logger.info("Successfully sent delete action data. Response: %s", response.text)
-            except requests.exceptions.RequestException as e:
-                _logger.error("Failed to send delete action data: %s", e)
-
-    def _send_lead_data(self, records, event):
-        param_obj = self.env['ir.config_parameter']
-        base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
-        mottasl_api_key = param_obj.get_param('mottasl_api_key')
-
-        if not mottasl_api_key:
+            events.append({
+                'name': 'CRM Lead Deleted',
+                'res_model': self._name,
+                'res_id': record['id'],
+                'company_id': record['company_id'],
+                'payload': delete_data,
+            })
+        Event._enqueue(events)
+
+    def _mottasl_send_data(self, records, event, snapshot=None):
+        self._send_lead_data(records, event, snapshot=snapshot)
+
+    def _send_lead_data(self, records, event, snapshot=None):
+        config = self.env['mottasl.event']._get_config()
+        if not config:
             _logger.error("API Key not configured. Unable to send lead data.")
             return
 
+        leads_data = records._mottasl_read()
+        Event = self.env['mottasl.event']
+        events = []
         for record in records:
+            data = leads_data[record.id]
+            if snapshot is not None:
+                # Update events only carry what changed since the snapshot
+                changes = self._mottasl_diff(snapshot.get(record.id, {}), data)
+                if not changes:
+                    _logger.debug("Skipping record %s because nothing relevant changed", record.id)
+                    continue
+                data = {'id': record.id, 'changes': changes}
+            destination = Event._get_destination(record.company_id.id)
+            if not destination:
+                _logger.warning("No Mottasl API key for the company of %s %s, event not sent", self._name, record.id)
+                continue
             partner = record.partner_id
             additional_data = {
                 'customer_phone': partner.phone,
                 'event': event,
-                'business_id':mottasl_api_key,
-                'lead_url': f'{base_url}/web#id={record.id}&view_type=form&model=crm.lead'
+                'business_id': destination.api_key,
+                'lead_url': f'{config.base_url}/web#id={record.id}&view_type=form&model=crm.lead'
                 # Add other necessary fields here
             }
 
-            _logger.info("Extracted partner data: %s", additional_data)
-
-            record_data = {"data":record.read()[0]}
+            record_data = {"data": data}
 
             record_data.update(additional_data)  # Merge additional data into the record data
 
-            _logger.info("Final record data to be sent: %s", record_data)
-
-            url = f'https://clients.twerlo.com/odoo-events?api_key={mottasl_api_key}'
-
-            _logger.info("Sending lead data to endpoint: %s", url)
-            try:
-                json_data = json.dumps(record_data, cls=DateTimeEncoder)
-
-                response = requests.post(
-                    url,
-                    data=json_data,  # Use json parameter for automatic JSON serialization
-                    headers={'Content-Type': 'application/json', 'event-name': event},
-                    timeout=60  # Increase the timeout to 60 seconds
-                )
-                response.raise_for_status()
-                _logger.info("Successfully sent lead data. Response: %s", response.text)
-            except requests.exceptions.RequestException as e:
-                _logger.error("Failed to send lead data: %s", e)
+            events.append({
+                'name': event,
+                'res_model': self._name,
+                'res_id': record.id,
+                'company_id': record.company_id.id,
+                'payload': record_data,
+            })
+        Event._enqueue(events)
@@ -1,132 +1,132 @@
-import json
 import logging
-from datetime import date, datetime
-
-import requests
 
 from odoo import models, api
 
 _logger = logging.getLogger(__name__)
 
 
-class DateTimeEncoder(json.JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, date):
-            return obj.isoformat()
-        return super(DateTimeEncoder, self).default(obj)
-
-
 class AccountMove(models.Model):
-    _inherit = 'account.move'
-
-    @api.model
-    def _get_api_key(self):
-        api_config = self.env['api.configuration'].search([], limit=1)
-        return api_config.api_key if api_config else None
+    _inherit = ['account.move', 'mottasl.event.mixin']
+
+    _mottasl_fields = (
+        'name', 'ref', 'state', 'move_type', 'partner_id', 'company_id', 'currency_id',
+        'date', 'invoice_date', 'invoice_date_due', 'invoice_origin', 'invoice_user_id',
+        'payment_reference', 'payment_state', 'amount_untaxed', 'amount_tax',
+        'amount_total', 'amount_residual', 'create_date', 'write_date',
+    )
+    _mottasl_filters = {
+        # Customer invoices only
+        'invoice.create': [('move_type', '=', 'out_invoice')],
+        'invoice.update': [('move_type', '=', 'out_invoice')],
+        'invoice.delete': [('move_type', '=', 'out_invoice')],
+    }
+    _mottasl_backfill_event = 'invoice.create'
 
     @api.model_create_multi
     def create(self, vals_list):
-        _logger.info("Creating new invoices with values: %s", vals_list)
+        if self._mottasl_is_bulk(len(vals_list)):
+            _logger.info("Creating %s invoices in bulk import mode", len(vals_list))
+        elif self._mottasl_log_sample(_logger):
+            _logger.debug("Creating new invoices with values: %s", vals_list)
         records = super(AccountMove, self).create(vals_list)
-        self._send_invoice_data(records, event='invoice.create')
+        records._mottasl_collect('create', 'invoice.create')
         return records
 
     def write(self, vals):
-        _logger.info("Updating invoices with values: %s", vals)
+        if self._mottasl_log_sample(_logger):
+            _logger.debug("Updating invoices %s with values: %s", self.ids, vals)
+        snapshot = self._mottasl_snapshot(vals)  # Projected data before the write, None if irrelevant
         result = super(AccountMove, self).write(vals)
-        self._send_invoice_data(self, event='invoice.update')
+        if snapshot is not None:
+            self._mottasl_collect('update', 'invoice.update', snapshot)
         return result
 
     def unlink(self):
-        _logger.info("Deleting invoices with ids: %s", self.ids)
-        records = self.read(['id', 'move_type', 'partner_id'])  # Read necessary data before deletion
+        _logger.info("Deleting %s invoices", len(self))
+        _logger.debug("Deleting invoices with ids: %s", self.ids)
+        delete_data = self._mottasl_read_delete_data('invoice.delete')  # Snapshot before deletion
+        # through the ORM, so that the attachments of the cached PDFs go too
+        self.env['mottasl.invoice.pdf'].sudo().search([('move_id', 'in', self.ids)]).unlink()
         result = super(AccountMove, self).unlink()
-        self._send_delete_action(records)
+        if delete_data:
+            self._mottasl_collect('delete', 'invoice.delete', delete_data)
         return result
 
     def _send_delete_action(self, records):
-        param_obj = self.env['ir.config_parameter']
-        mottasl_api_key = param_obj.get_param('mottasl_api_key')
-
-        if not mottasl_api_key:
+        config = self.env['mottasl.event']._get_config()
+        if not config:
             _logger.error("API Key not configured. Unable to send delete action.")
             return
 
+        Event = self.env['mottasl.event']
+        events = []
         for record in records:
-            if record['move_type'] == 'out_invoice':  # Check if it's a customer invoice
-                partner = self.env['res.partner'].browse(record['partner_id'][0])
-                customer_phone = partner.phone or partner.mobile or 'N/A'
-
-                url = f'https://clients.twerlo.com/odoo-events?api_key={mottasl_api_key}'
-
-                delete_data = {
-                   'data':{
-                     'id': record['id'],
-                     'customer_phone': customer_phone,
-                    'deletion_date': datetime.now().isoformat(),},
-                    'event': 'invoice.delete',
-                    'business_id':mottasl_api_key,
-                    
-                }
-
-                _logger.info("Sending delete action data to endpoint: %s", url)
-                try:
-                    json_data = json.dumps(delete_data, cls=DateTimeEncoder)
-                    response = requests.post(
-                        url,
-                        data=json_data,
-                        headers={'Content-Type': 'application/json'},
-                        timeout=60  # Increase the timeout to 60 seconds
-                    )
-                    response.raise_for_status()
-                    _logger.info("Successfully sent delete action data. Response: %s", response.text)
-                except requests.exceptions.RequestException as e:
-                    _logger.error("Failed to send delete action data: %s", e)
-
-    def _send_invoice_data(self, records, event):
-        param_obj = self.env['ir.config_parameter']
-        base_url = self.env['ir.config_parameter'].sudo().get_param('web.base.url')
-        mottasl_api_key = param_obj.get_param('mottasl_api_key')
-
-        if not mottasl_api_key:
+            destination = Event._get_destination(record['company_id'])
+            if not destination:
+                _logger.warning("No Mottasl API key for the company of %s %s, delete not sent", self._name, record['id'])
+                continue
+            delete_data = {
+               'data':{
+                 'id': record['id'],
+                 'customer_phone': record['customer_phone'],
+                'deletion_date': record['deletion_date'],},
+                'event': 'invoice.delete',
+                'business_id': destination.api_key,
+                
+            }
+            events.append({
+                'name': 'invoice.delete',
+                'res_model': self._name,
+                'res_id': record['id'],
+                'company_id': record['company_id'],
+                'payload': delete_data,
+            })
+        Event._enqueue(events)
+
+    def _mottasl_send_data(self, records, event, snapshot=None):
+        self._send_invoice_data(records, event, snapshot=snapshot)
+
+    def _send_invoice_data(self, records, event, snapshot=None):
+        config = self.env['mottasl.event']._get_config()
+        if not config:
             _logger.error("API Key not configured. Unable to send invoice data.")
             return
 
+        invoices_data = records._mottasl_read()
+        # historical invoices get their PDF on the first click, not all at once
+        pdf_tokens = self.env['mottasl.invoice.pdf']._get_tokens(records, eager=not self.env.context.get('mottasl_backfill'))
+        Event = self.env['mottasl.event']
+        events = []
         for record in records:
-            if record.move_type == 'out_invoice':  # Check if it's a customer invoice and status is "posted"
-                partner = record.partner_id
-                additional_data = {
-                    'customer_phone': partner.phone,
-                    'event': event,
-                    'business_id':mottasl_api_key,
-                    'invoice_pdf_url': f'{base_url}/report/pdf/account.report_invoice_with_payments/{record.id}'
-                }
-
-                _logger.info("Extracted partner data: %s", additional_data)
-
-                record_data ={"data": record.read()[0]}
-                if 'invoice_pdf_report_file' in record_data:
-                    del record_data['invoice_pdf_report_file']  # Remove the key if it exists
-
-                record_data.update(additional_data)  # Merge additional data into the record data
-
-                _logger.info("Final record data to be sent: %s", record_data)
-
-                url = f'https://clients.twerlo.com/odoo-events?api_key={mottasl_api_key}'
-
-                _logger.info("Sending invoice data to endpoint: %s", url)
-                try:
-                    json_data = json.dumps(record_data, cls=DateTimeEncoder)
-
-                    response = requests.post(
-                        url,
-                        data=json_data,  # Use json parameter for automatic JSON serialization
-                        headers={'Content-Type': 'application/json', 'event': event},
-                        timeout=60  # Increase the timeout to 60 seconds
-                    )
-                    response.raise_for_status()
-                    _logger.info("Successfully sent invoice data. Response: %s", response.text)
-                except requests.exceptions.RequestException as e:
-                    _logger.error("Failed to send invoice data: %s", e)
-            else:
-                _logger.info("Skipping record %s because status is not 'posted'", record.id)
+            data = invoices_data[record.id]
+            if snapshot is not None:
+                # Update events only carry what changed since the snapshot
+                changes = self._mottasl_diff(snapshot.get(record.id, {}), data)
+                if not changes:
+                    _logger.debug("Skipping record %s because nothing relevant changed", record.id)
+                    continue
+                data = {'id': record.id, 'changes': changes}
+            destination = Event._get_destination(record.company_id.id)
+            if not destination:
+                _logger.warning("No Mottasl API key for the company of %s %s, event not sent", self._name, record.id)
+                continue
+            partner = record.partner_id
+            additional_data = {
+                'customer_phone': partner.phone,
+                'event': event,
+                'business_id': destination.api_key,
+                'invoice_pdf_url': f'{config.base_url}/mottasl/invoice/{record.id}/{pdf_tokens[record.id]}',
+            }
+
+            record_data = {"data": data}
+
+            record_data.update(additional_data)  # Merge additional data into the record data
+
+            events.append({
+                'name': event,
+                'res_model': self._name,
+                'res_id': record.id,
+                'company_id': record.company_id.id,
+                'payload': record_data,
+            })
+        Event._enqueue(events)
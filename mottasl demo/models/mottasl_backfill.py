@@ -0,0 +1,123 @@
+import logging
+import threading
+import time
+from datetime import timedelta
+
+from odoo import api, fields, models
+from odoo.exceptions import UserError
+
+_logger = logging.getLogger(__name__)
+
+DEFAULT_BACKFILL_CHUNK_SIZE = 500
+# pending outbox events above which the backfill waits for the dispatcher
+DEFAULT_BACKFILL_MAX_PENDING = 5000
+# seconds a cron run may spend before handing over to the next one
+DEFAULT_BACKFILL_TIME_BUDGET = 60
+BACKFILL_PAUSE = 30
+
+
+class MottaslBackfill(models.Model):
+    """Initial sync of the records that existed before Mottasl was connected.
+
+    A job walks the records of its model matching the filter of the model's
+    create event by increasing id, one chunk per transaction, and queues
+    them as that create event, with the same projection
+    and delivery (batching, retries) as live events. The cursor is committed
+    with the events of its chunk, so a job resumes where it stopped after a
+    restart, and the job pauses while the outbox is above a high-water mark:
+    the dispatcher sets the pace, not the backfill.
+    """
+    _name = 'mottasl.backfill'
+    _description = 'Mottasl Backfill'
+    _order = 'id desc'
+    _rec_name = 'res_model'
+
+    res_model = fields.Selection([
+        ('account.move', 'Invoice'),
+        ('sale.order', 'Sales Order'),
+        ('crm.lead', 'Lead'),
+    ], string='Model', required=True)
+    state = fields.Selection([
+        ('draft', 'Draft'),
+        ('running', 'Running'),
+        ('done', 'Done'),
+        ('cancel', 'Cancelled'),
+    ], default='draft', required=True, index=True, readonly=True)
+    last_id = fields.Integer(string='Cursor', readonly=True, help="Records up to this id have been queued")
+    total = fields.Integer(readonly=True, help="Records to send, counted when the job started")
+    processed = fields.Integer(readonly=True)
+    progress = fields.Float(compute='_compute_progress')
+    date_start = fields.Datetime(string='Started', readonly=True)
+    date_end = fields.Datetime(string='Finished', readonly=True)
+
+    @api.depends('processed', 'total')
+    def _compute_progress(self):
+        for job in self:
+            job.progress = 100.0 * job.processed / job.total if job.total else 0.0
+
+    def _get_domain(self):
+        self.ensure_one()
+        model = self.env[self.res_model]
+        return [*model._mottasl_get_filter(model._mottasl_backfill_event), ('id', '>', self.last_id)]
+
+    def action_start(self):
+        """Start the jobs, or resume them from their cursor."""
+        for job in self:
+            if job.res_model not in self.env:
+                raise UserError(f"The model {job.res_model} is not installed.")
+            job.write({
+                'state': 'running',
+                'total': job.processed + self.env[job.res_model].search_count(job._get_domain()),
+                'date_start': job.date_start or fields.Datetime.now(),
+                'date_end': False,
+            })
+        self.env.ref(f'{self._module}.ir_cron_mottasl_backfill').sudo()._trigger()
+
+    def action_cancel(self):
+        self.filtered(lambda job: job.state == 'running').write({'state': 'cancel'})
+
+    @api.model
+    def _cron_process(self):
+        config = self.env['mottasl.event']._get_config()
+        if not config:
+            _logger.error("API Key not configured. Unable to run the Mottasl backfill.")
+            return
+
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        chunk_size = max(int(get_param('mottasl.backfill_chunk_size', DEFAULT_BACKFILL_CHUNK_SIZE)), 1)
+        max_pending = max(int(get_param('mottasl.backfill_max_pending', DEFAULT_BACKFILL_MAX_PENDING)), 1)
+        deadline = time.monotonic() + int(get_param('mottasl.backfill_time_budget', DEFAULT_BACKFILL_TIME_BUDGET))
+        cron = self.env.ref(f'{self._module}.ir_cron_mottasl_backfill').sudo()
+        testing = getattr(threading.current_thread(), 'testing', False)
+        Event = self.env['mottasl.event']
+
+        for job in self.search([('state', '=', 'running')], order='id'):
+            if job.res_model not in self.env:
+                _logger.warning("Mottasl backfill of %s skipped, the model is not installed", job.res_model)
+                continue
+            while job.state == 'running':
+                if time.monotonic() > deadline:
+                    cron._trigger()
+                    return
+                if Event.search_count([('state', '=', 'pending')], limit=max_pending) >= max_pending:
+                    # let the dispatcher catch up before queueing more
+                    cron._trigger(at=fields.Datetime.now() + timedelta(seconds=BACKFILL_PAUSE))
+                    return
+                job._process_chunk(chunk_size)
+                if not testing:
+                    self.env.cr.commit()
+                # keep memory bounded whatever the size of the model
+                self.env.invalidate_all()
+
+    def _process_chunk(self, chunk_size):
+        """Queue the next ``chunk_size`` records of the job and move its cursor."""
+        self.ensure_one()
+        model = self.env[self.res_model]
+        records = model.search(self._get_domain(), order='id', limit=chunk_size)
+        if not records:
+            self.write({'state': 'done', 'date_end': fields.Datetime.now()})
+            _logger.info("Mottasl backfill of %s done, %s records queued", self.res_model, self.processed)
+            return
+        model.with_context(mottasl_backfill=True)._mottasl_send_data(records, model._mottasl_backfill_event)
+        self.write({'last_id': records[-1].id, 'processed': self.processed + len(records)})
+        _logger.info("Mottasl backfill of %s: %s/%s records queued", self.res_model, self.processed, self.total)
@@ -0,0 +1,606 @@
+import json
+import logging
+import random
+import threading
+import time
+import zlib
+from collections import Counter, defaultdict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+
+import requests
+
+from odoo import api, fields, models, tools
+from odoo.tools import frozendict, split_every, str2bool
+
+from ..tools import breaker, logs, metrics, serializer, transport
+
+_logger = logging.getLogger(__name__)
+
+MOTTASL_EVENTS_URL = 'https://clients.twerlo.com/odoo-events'
+MAX_ATTEMPTS = 10
+# retry delays in seconds, doubled on each attempt
+RETRY_BASE_DELAY = 30
+RETRY_MAX_DELAY = 3600
+BATCH_EVENT = 'batch'
+DEFAULT_BATCH_MAX_EVENTS = 100
+DEFAULT_BATCH_MAX_BYTES = 1024 * 1024
+DEFAULT_BATCH_MAX_AGE = 30
+DEFAULT_DISPATCH_CONCURRENCY = 4
+DEFAULT_DISPATCH_PARTITIONS = 16
+DEFAULT_DISPATCH_WORKERS = 1
+DEFAULT_BULK_THRESHOLD = 1000
+DEFAULT_BULK_BATCH_SIZE = 1000
+# keys of the event data that change without the content changing
+CONTENT_HASH_IGNORED = frozenset(('write_date', 'write_uid', 'deletion_date'))
+
+MottaslConfig = namedtuple('MottaslConfig', [
+    'base_url',     # web.base.url, for the links sent in the events
+    'headers',      # static request headers
+    'batch',        # (max_events, max_bytes, max_age) or None when batching is off
+    'concurrency',  # maximum number of requests in flight to each destination
+    'partitions',   # number of outbox partitions shared by the dispatch workers
+    'bulk',         # (threshold, batch_size) of the bulk import mode
+    'transport',    # keyword arguments of transport.post()
+    'retry',        # (base_delay, max_delay) of the retries, in seconds
+    'breaker_reset_timeout',  # seconds an open circuit waits before a probe
+    'log_sample_rate',  # share of the payloads logged at DEBUG level
+])
+
+MottaslDestination = namedtuple('MottaslDestination', [
+    'api_key',      # Mottasl business id, also sent in the url
+    'url',          # endpoint url with the api key
+])
+
+
+class MottaslEvent(models.Model):
+    """Outbox of events waiting to be delivered to Mottasl.
+
+    Business models only insert rows here, inside their own transaction. The
+    dispatch cron sends them once that transaction has committed, so a slow
+    endpoint never holds ORM locks and rolled back writes never leave the
+    database.
+    """
+    _name = 'mottasl.event'
+    _description = 'Mottasl Outbox Event'
+    _order = 'id'
+
+    name = fields.Char(string='Event', required=True, index=True)
+    res_model = fields.Char(string='Model', required=True, index=True)
+    res_id = fields.Integer(string='Record ID', index=True)
+    company_id = fields.Many2one('res.company', string='Company', index=True,
+                                 help="Company of the record, its Mottasl account receives the event")
+    payload = fields.Text(required=True)
+    state = fields.Selection([
+        ('pending', 'Pending'),
+        ('done', 'Sent'),
+    ], default='pending', required=True, index=True)
+    attempts = fields.Integer(default=0)
+    next_attempt_date = fields.Datetime(index=True, help="Failed events are retried after this date")
+    last_error = fields.Text()
+    last_http_status = fields.Integer(string='Last HTTP Status')
+    sent_date = fields.Datetime()
+    partition_hash = fields.Integer(help="Hash of the record, the event belongs to partition "
+                                         "partition_hash % mottasl.dispatch_partitions")
+    content_hash = fields.Char(help="Hash of the payload content, events identical to the last one "
+                                    "delivered for the same record and event are not sent again")
+
+    @api.model
+    def _enqueue(self, vals_list):
+        """Store events for delivery after the current transaction commits.
+
+        ``payload`` values may be given as dicts, they are serialized here.
+        """
+        if not vals_list:
+            return self.browse()
+        if self.env.context.get('mottasl_bulk_enqueue'):
+            return self.with_context(mottasl_bulk_enqueue=False)._enqueue_bulk(vals_list)
+        config = self._get_config()
+        log_sample_rate = config.log_sample_rate if config else 0
+        for vals in vals_list:
+            vals['partition_hash'] = _partition_hash(vals['res_model'], vals.get('res_id'))
+            if 'content_hash' not in vals:
+                vals['content_hash'] = _content_hash(vals['payload'])
+            if not isinstance(vals['payload'], str):
+                start = time.perf_counter()
+                vals['payload'] = serializer.dumps(vals['payload'])
+                metrics.registry.observe('mottasl_serialization_seconds', time.perf_counter() - start, event=vals['name'])
+            metrics.registry.observe('mottasl_payload_bytes', len(vals['payload']),
+                                     buckets=metrics.BYTES_BUCKETS, event=vals['name'])
+            metrics.registry.inc('mottasl_events_queued_total', event=vals['name'])
+            _logger.info("Queued Mottasl event %s for %s,%s (%s bytes)",
+                         vals['name'], vals['res_model'], vals.get('res_id'), len(vals['payload']))
+            if logs.sample(_logger, log_sample_rate):
+                _logger.debug("Payload of Mottasl event %s for %s,%s: %s",
+                              vals['name'], vals['res_model'], vals.get('res_id'), vals['payload'])
+        events = self.sudo().create(vals_list)
+        self._trigger_dispatch()
+        self.env['mottasl.metric']._flush_after_commit()
+        return events
+
+    @api.model
+    def _enqueue_bulk(self, vals_list):
+        """Store the events of a bulk import as a few large batch envelopes
+        of ``mottasl.bulk_batch_size`` events each, one outbox row per
+        envelope instead of one per event."""
+        _threshold, batch_size = self._get_config().bulk
+        groups = defaultdict(list)
+        for vals in vals_list:
+            payload = vals['payload']
+            groups[vals['res_model'], vals.get('company_id') or False].append(
+                payload if isinstance(payload, str) else serializer.dumps(payload)
+            )
+        rows = [{
+            'name': BATCH_EVENT,
+            'res_model': res_model,
+            'res_id': 0,
+            'company_id': company_id,
+            'payload': b''.join(serializer.iterencode_batch(
+                {'business_id': self._get_destination(company_id).api_key, 'event': BATCH_EVENT}, chunk,
+            )).decode(),
+            'content_hash': False,
+        } for (res_model, company_id), payloads in groups.items() for chunk in split_every(batch_size, payloads)]
+        _logger.info("Queueing %s Mottasl events in %s bulk envelopes", len(vals_list), len(rows))
+        return self._enqueue(rows)
+
+    @api.model
+    def _trigger_dispatch(self):
+        # one trigger per transaction is enough, the workers drain everything
+        data = self.env.cr.precommit.data
+        if data.get('mottasl.dispatch_triggered'):
+            return
+        data['mottasl.dispatch_triggered'] = True
+        for cron in self._get_dispatch_crons().filtered('active'):
+            cron._trigger()  # singleton only
+
+    @api.model
+    def _get_dispatch_crons(self):
+        """Return the dispatch worker crons, the one of the module first."""
+        cron = self.env.ref(f'{self._module}.ir_cron_mottasl_event_dispatch', raise_if_not_found=False)
+        if not cron:
+            return self.env['ir.cron']
+        cron = cron.sudo()
+        return cron | cron.with_context(active_test=False).search([
+            ('model_id', '=', cron.model_id.id), ('code', '=', cron.code), ('id', '!=', cron.id),
+        ], order='id')
+
+    @api.model
+    def _sync_dispatch_workers(self):
+        """Create or remove copies of the dispatch cron so that
+        ``mottasl.dispatch_workers`` of them run, possibly in parallel on
+        several worker processes or nodes."""
+        count = max(int(self.env['ir.config_parameter'].sudo().get_param(
+            'mottasl.dispatch_workers', DEFAULT_DISPATCH_WORKERS)), 1)
+        crons = self._get_dispatch_crons()
+        if not crons:
+            return
+        main, workers = crons[0], crons[1:]
+        workers[count - 1:].unlink()
+        for number in range(len(workers) + 2, count + 1):
+            main.copy({'name': f'{main.name} ({number})'})
+
+    @api.model
+    @tools.ormcache()
+    def _get_config(self):
+        """Return the Mottasl configuration as a :class:`MottaslConfig`, or
+        ``None`` when neither a default nor a company API key is set.
+
+        Cached until the settings are saved, a system parameter changes or a
+        company account is modified, so the ORM hot path does not query the
+        configuration.
+        """
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        if not get_param('mottasl_api_key') and not self.env['res.company'].sudo().search_count(
+            [('mottasl_api_key', '!=', False)], limit=1,
+        ):
+            return None
+        batch = None
+        if str2bool(get_param('mottasl.batch_enabled', 'False')):
+            batch = (
+                max(int(get_param('mottasl.batch_max_events', DEFAULT_BATCH_MAX_EVENTS)), 1),
+                max(int(get_param('mottasl.batch_max_bytes', DEFAULT_BATCH_MAX_BYTES)), 1),
+                max(int(get_param('mottasl.batch_max_age', DEFAULT_BATCH_MAX_AGE)), 0),
+            )
+        return MottaslConfig(
+            base_url=get_param('web.base.url'),
+            headers=frozendict({'Content-Type': 'application/json'}),
+            batch=batch,
+            concurrency=max(int(get_param('mottasl.dispatch_concurrency', DEFAULT_DISPATCH_CONCURRENCY)), 1),
+            partitions=max(int(get_param('mottasl.dispatch_partitions', DEFAULT_DISPATCH_PARTITIONS)), 1),
+            bulk=(
+                max(int(get_param('mottasl.bulk_threshold', DEFAULT_BULK_THRESHOLD)), 1),
+                max(int(get_param('mottasl.bulk_batch_size', DEFAULT_BULK_BATCH_SIZE)), 1),
+            ),
+            transport=frozendict({
+                'connect_timeout': float(get_param('mottasl.connect_timeout', transport.DEFAULT_CONNECT_TIMEOUT)),
+                'read_timeout': float(get_param('mottasl.read_timeout', transport.DEFAULT_READ_TIMEOUT)),
+                'pool_size': int(get_param('mottasl.pool_size', transport.DEFAULT_POOL_SIZE)),
+                # the default endpoint and those of the companies
+                'pool_hosts': 1 + self.env['res.company'].sudo().search_count([('mottasl_endpoint_url', '!=', False)]),
+                'compress': str2bool(get_param('mottasl.compression', 'False')),
+            }),
+            retry=(
+                max(int(get_param('mottasl.retry_base_delay', RETRY_BASE_DELAY)), 0),
+                max(int(get_param('mottasl.retry_max_delay', RETRY_MAX_DELAY)), 0),
+            ),
+            breaker_reset_timeout=max(float(get_param('mottasl.breaker_reset_timeout', breaker.DEFAULT_RESET_TIMEOUT)), 0),
+            log_sample_rate=min(max(float(get_param('mottasl.log_payload_sample_rate', logs.DEFAULT_PAYLOAD_SAMPLE_RATE)), 0), 1),
+        )
+
+    @api.model
+    @tools.ormcache('company_id')
+    def _get_destination(self, company_id):
+        """Return the :class:`MottaslDestination` of the events of the records
+        of ``company_id``: the account of the company if it has one, else
+        the default account; ``None`` when neither is set."""
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        company = self.env['res.company'].sudo().browse(company_id)
+        api_key = company.mottasl_api_key or get_param('mottasl_api_key')
+        if not api_key:
+            return None
+        endpoint = company.mottasl_endpoint_url or get_param('mottasl.endpoint_url') or MOTTASL_EVENTS_URL
+        return MottaslDestination(api_key=api_key, url=f'{endpoint}?api_key={api_key}')
+
+    @api.model
+    def _cron_dispatch(self, limit=500):
+        """Deliver the due events, one outbox partition at a time.
+
+        Events are partitioned by a hash of their record, and each dispatch
+        worker cron claims the partitions no other worker holds with ``SELECT
+        ... FOR UPDATE SKIP LOCKED``. Workers on several processes or nodes
+        thus deliver in parallel, while the events of a record, always in the
+        same partition, are sent by one worker at a time and in order.
+        """
+        config = self._get_config()
+        if not config:
+            _logger.error("API Key not configured. Unable to dispatch Mottasl events.")
+            return
+
+        cron = self.env.ref(f'{self._module}.ir_cron_mottasl_event_dispatch').sudo()
+        testing = getattr(threading.current_thread(), 'testing', False)
+        Partition = self.env['mottasl.event.partition']
+        claimed, full, wake_at = [], False, None
+        while True:
+            partition = Partition._claim(config.partitions, claimed)
+            if not partition:
+                break  # all partitions visited or held by other workers
+            claimed.append(partition[0])
+            partition_full, partition_wake_at = self._dispatch_partition(config, partition, limit)
+            full = full or partition_full
+            if partition_wake_at and (not wake_at or partition_wake_at < wake_at):
+                wake_at = partition_wake_at
+            if not testing:
+                self.env.cr.commit()  # releases the partition
+
+        if full:
+            self._trigger_dispatch()
+        else:
+            if wake_at:
+                cron._trigger(at=wake_at)
+            self._schedule_retry(cron)
+        if metrics.registry.flush_due():
+            # the delivery metrics are only recorded by the cron workers
+            self.env['mottasl.metric']._flush()
+
+    def _dispatch_partition(self, config, partition, limit):
+        """Deliver the due events of ``partition``, separately for each
+        destination: a slow or failing Mottasl account, or one with a large
+        backlog, does not hold back the events of the others.
+
+        Return ``(full, wake_at)``: whether a destination delivered now had
+        more than ``limit`` due events, and the date of the next visit needed by a
+        batch left to fill up or an open circuit, if any.
+        """
+        due = self._get_due_events(limit, partition)
+        full, wake_at = False, None
+        destinations = defaultdict(lambda: self.browse())
+        for event in due:
+            destinations[event.company_id.id] |= event
+        now = fields.Datetime.now()
+        deliveries = []
+        for company_id, events in destinations.items():
+            destination = self._get_destination(company_id)
+            if not destination:
+                events._mark_failed("No Mottasl API key configured for the company of the records")
+                continue
+            circuit = breaker.get_breaker(destination.url, reset_timeout=config.breaker_reset_timeout)
+            next_visit = None
+            if circuit.state == breaker.OPEN:
+                # the endpoint is down, keep the events for when it is back
+                _logger.info("Mottasl circuit of company %s is open, postponing its events by %ss",
+                             company_id, int(circuit.retry_in()))
+                next_visit = now + timedelta(seconds=circuit.retry_in())
+            elif config.batch:
+                max_events, _max_bytes, max_age = config.batch
+                flush_at = events[0].create_date + timedelta(seconds=max_age)
+                if len(events) < max_events and flush_at > now:
+                    # not full and not old enough yet, come back when the oldest expires
+                    next_visit = flush_at
+            if next_visit:
+                wake_at = min(wake_at or next_visit, next_visit)
+                continue
+            # postponed destinations wait for wake_at, whatever their backlog
+            full = full or len(events) == limit
+            events = events._skip_duplicates()
+            # Events of a record always fall in the same lane and a lane is
+            # sent sequentially, so they never overtake each other.
+            for lane in events._split_lanes(config.concurrency):
+                units = lane._split_batches(*config.batch[:2]) if config.batch else lane
+                deliveries.append((destination, circuit, [unit._prepare_request(destination.api_key) for unit in units]))
+
+        if deliveries:
+            # a thread per lane, up to config.concurrency per destination: the
+            # lanes of a slow account never wait for a thread behind the others
+            with ThreadPoolExecutor(max_workers=len(deliveries)) as executor:
+                futures = [executor.submit(_deliver_lane, config, *delivery) for delivery in deliveries]
+                for future in futures:
+                    for event_ids, error, status in future.result():
+                        if error:
+                            self.browse(event_ids)._mark_failed(error, status)
+                        else:
+                            self.browse(event_ids)._mark_sent()
+        for _destination, circuit, _lane in deliveries:
+            if circuit.state != breaker.CLOSED:
+                retry_at = fields.Datetime.now() + timedelta(seconds=circuit.retry_in())
+                wake_at = min(wake_at or retry_at, retry_at)
+        return full, wake_at
+
+    @api.model
+    def _get_due_events(self, limit, partition=None):
+        """Return the pending events to send now, in order, at most ``limit``
+        per company so that the backlog of one Mottasl account never crowds
+        out the others, and only those of ``partition`` (``(number, total)``)
+        if given. Events of a record whose earlier event waits for a retry
+        are held back behind it, and the events of a model behind the
+        pending bulk envelopes of the same company, which cover many of its
+        records. Held back events are left out before the limit applies, so
+        that they never take the place of deliverable ones."""
+        self.flush_model()
+        number, total = partition or (0, 1)
+        self.env.cr.execute("""
+            SELECT id
+              FROM (
+                    SELECT event.id, ROW_NUMBER() OVER (PARTITION BY event.company_id ORDER BY event.id) AS rank
+                      FROM mottasl_event event
+                     WHERE event.state = 'pending'
+                       AND (event.next_attempt_date IS NULL OR event.next_attempt_date <= %(now)s)
+                       AND COALESCE(event.partition_hash, 0) %% %(total)s = %(number)s
+                       AND NOT EXISTS (
+                            SELECT 1
+                              FROM mottasl_event waiting
+                             WHERE waiting.state = 'pending' AND waiting.next_attempt_date > %(now)s
+                               AND waiting.res_model = event.res_model AND waiting.res_id = event.res_id
+                               AND waiting.company_id IS NOT DISTINCT FROM event.company_id
+                               AND waiting.id < event.id
+                       )
+                       AND NOT EXISTS (
+                            SELECT 1
+                              FROM mottasl_event bulk
+                             WHERE bulk.state = 'pending' AND bulk.name = %(batch)s
+                               AND bulk.res_model = event.res_model
+                               AND bulk.company_id IS NOT DISTINCT FROM event.company_id
+                               AND bulk.id < event.id
+                       )
+                   ) due
+             WHERE rank <= %(limit)s
+          ORDER BY id
+        """, {
+            'now': fields.Datetime.now(),
+            'total': total,
+            'number': number,
+            'batch': BATCH_EVENT,
+            'limit': limit,
+        })
+        return self.browse(row[0] for row in self.env.cr.fetchall())
+
+    @api.model
+    def _schedule_retry(self, cron):
+        """Wake the dispatcher up when the next failed event is due."""
+        event = self.search([
+            ('state', '=', 'pending'), ('next_attempt_date', '>', fields.Datetime.now()),
+        ], order='next_attempt_date', limit=1)
+        if event:
+            cron._trigger(at=event.next_attempt_date)
+
+    def _split_lanes(self, count):
+        """Split ``self`` into at most ``count`` lanes, keeping the events of a
+        given record together and in order."""
+        lanes = defaultdict(list)
+        for event in self:
+            lanes[hash((event.res_model, event.res_id)) % count].append(event.id)
+        return [self.browse(ids) for ids in lanes.values()]
+
+    def _split_batches(self, max_events, max_bytes):
+        """Yield consecutive sub-recordsets holding at most ``max_events``
+        events and roughly ``max_bytes`` of payload each."""
+        batch, size = [], 0
+        for event in self:
+            if event.name == BATCH_EVENT:
+                # a bulk envelope is already a batch, send it on its own
+                if batch:
+                    yield self.browse(batch)
+                    batch, size = [], 0
+                yield event
+                continue
+            length = len(event.payload.encode())
+            if batch and (len(batch) >= max_events or size + length > max_bytes):
+                yield self.browse(batch)
+                batch, size = [], 0
+            batch.append(event.id)
+            size += length + 1
+        if batch:
+            yield self.browse(batch)
+
+    def _prepare_request(self, mottasl_api_key):
+        """Return ``(event_ids, data, event_name, size)`` to deliver ``self``,
+        a single event or a batch wrapped in an envelope, of about ``size``
+        bytes.
+
+        Each event carries its outbox id as ``sequence``: the events of a
+        record are queued in the order they happened, so subscribers can
+        order them, and ignore stale ones, by this number.
+        """
+        # payloads are already serialized, splice them instead of decoding them again
+        payloads = [serializer.prepend_member(event.payload, 'sequence', event.id) for event in self]
+        size = sum(len(payload) for payload in payloads)
+        if len(self) == 1:
+            return self.ids, payloads[0], self.name, size
+        data = serializer.iterencode_batch(
+            {'business_id': mottasl_api_key, 'event': BATCH_EVENT}, payloads,
+        )
+        return self.ids, data, BATCH_EVENT, size
+
+    def _skip_duplicates(self):
+        """Mark as sent, without sending them, the events whose content is
+        the last one delivered for the same record and event, and return the
+        others. An event is only compared with delivered ones, never with an
+        earlier pending event that might still fail."""
+        keys = {(event.res_model, event.res_id, event.name) for event in self if event.content_hash}
+        delivered = self.env['mottasl.event.hash']._get_hashes(keys)
+        duplicates = []
+        for event in self:
+            key = (event.res_model, event.res_id, event.name)
+            if event.content_hash and delivered.get(key) == event.content_hash:
+                duplicates.append(event.id)
+            else:
+                # later events of the key follow one that is not delivered yet
+                delivered.pop(key, None)
+        if not duplicates:
+            return self
+        duplicates = self.browse(duplicates)
+        duplicates.write({'state': 'done', 'sent_date': fields.Datetime.now()})
+        for name, count in Counter(duplicates.mapped('name')).items():
+            metrics.registry.inc('mottasl_events_deduplicated_total', count, event=name)
+        _logger.info("Skipped %s Mottasl events identical to the last delivered ones", len(duplicates))
+        return self - duplicates
+
+    def _mark_sent(self):
+        self.write({'state': 'done', 'sent_date': fields.Datetime.now()})
+        self.env['mottasl.event.hash']._set_hashes({
+            (event.res_model, event.res_id, event.name): event.content_hash
+            for event in self.sorted('id') if event.content_hash
+        })
+
+    def _mark_failed(self, error, status=None):
+        """Record a failed attempt and schedule the next one with a jittered
+        exponential backoff. Events rejected by Mottasl or out of attempts are
+        moved to the dead letters."""
+        now = fields.Datetime.now()
+        config = self._get_config()
+        base_delay, max_delay = config.retry if config else (RETRY_BASE_DELAY, RETRY_MAX_DELAY)
+        dead = self.browse()
+        for event in self:
+            attempts = event.attempts + 1
+            if attempts >= MAX_ATTEMPTS or _is_permanent_failure(status):
+                dead |= event
+            delay = min(base_delay * 2 ** (attempts - 1), max_delay)
+            event.write({
+                'attempts': attempts,
+                'last_error': error,
+                'last_http_status': status,
+                'next_attempt_date': now + timedelta(seconds=delay * random.uniform(0.5, 1)),
+            })
+        if dead:
+            dead._move_to_dead_letters()
+
+    def _move_to_dead_letters(self):
+        self.env['mottasl.event.dead'].create([{
+            'name': event.name,
+            'res_model': event.res_model,
+            'res_id': event.res_id,
+            'company_id': event.company_id.id,
+            'payload': event.payload,
+            'reason': event.last_error,
+            'attempts': event.attempts,
+            'last_http_status': event.last_http_status,
+            'event_date': event.create_date,
+        } for event in self])
+        _logger.warning("Moved %s Mottasl events to the dead letters", len(self))
+        self.unlink()
+
+    @api.model
+    def _get_metrics_gauges(self):
+        """Return the ``(name, labels, value)`` gauges read from the database."""
+        self.env.cr.execute("""
+            SELECT CASE WHEN attempts > 0 THEN 'retrying' ELSE 'pending' END, COUNT(*)
+              FROM mottasl_event
+             WHERE state = 'pending'
+          GROUP BY 1
+        """)
+        depth = dict(self.env.cr.fetchall())
+        gauges = [('mottasl_queue_depth', {'state': state}, depth.get(state, 0)) for state in ('pending', 'retrying')]
+        gauges.append(('mottasl_dead_letters', {}, self.env['mottasl.event.dead'].search_count([])))
+        return gauges
+
+    @api.autovacuum
+    def _gc_sent_events(self):
+        limit_date = fields.Datetime.now() - timedelta(days=7)
+        self.sudo().search([('state', '=', 'done'), ('sent_date', '<', limit_date)]).unlink()
+
+
+def _partition_hash(res_model, res_id):
+    """Return a hash of the record of an event, stable across processes."""
+    return zlib.crc32(f'{res_model},{res_id or 0}'.encode()) & 0x7fffffff
+
+
+def _content_hash(payload):
+    """Return the hash of the content of an event ``payload`` (dict or JSON),
+    leaving out the bookkeeping values that differ between identical events."""
+    if isinstance(payload, str):
+        payload = json.loads(payload)
+    data = payload.get('data')
+    if isinstance(data, dict):
+        payload = dict(payload, data={key: value for key, value in data.items() if key not in CONTENT_HASH_IGNORED})
+    return serializer.digest(payload)
+
+
+def _is_permanent_failure(status):
+    """Return whether a request that failed with HTTP ``status`` (``None``
+    for network errors) would fail again if retried unchanged."""
+    return status is not None and 400 <= status < 500 and status not in (408, 429)
+
+
+def _deliver_lane(config, destination, circuit, lane):
+    """Send the prepared requests of a lane to ``destination`` in order,
+    stopping at the first failure so that later events of the same records
+    are not sent before it. The lane also stops, leaving its events pending,
+    when ``circuit``, the breaker of the destination, opens.
+
+    Runs in a dispatcher thread: no ORM access here, results are returned as
+    ``(event_ids, error, http_status)`` tuples and applied by the caller.
+    """
+    results = []
+    for event_ids, data, event_name, size in lane:
+        if not circuit.allow():
+            break
+        start = time.perf_counter()
+        try:
+            response = transport.post(
+                destination.url, data, headers=dict(config.headers, event=event_name), **config.transport,
+            )
+        except requests.exceptions.RequestException as e:
+            status = getattr(e.response, 'status_code', None)
+            latency = time.perf_counter() - start
+            metrics.registry.observe('mottasl_http_request_seconds', latency, event=event_name)
+            metrics.registry.inc('mottasl_http_requests_total', event=event_name, outcome='failure')
+            metrics.registry.inc('mottasl_events_failed_total', len(event_ids), event=event_name)
+            # a rejected request says nothing about the health of the endpoint
+            if _is_permanent_failure(status):
+                circuit.record_success()
+            else:
+                circuit.record_failure()
+            _logger.error("Failed to send %s to Mottasl: %s events, %s bytes, %dms: %s",
+                          event_name, len(event_ids), size, latency * 1000, e)
+            results.append((event_ids, str(e), status))
+            break
+        latency = time.perf_counter() - start
+        metrics.registry.observe('mottasl_http_request_seconds', latency, event=event_name)
+        metrics.registry.inc('mottasl_http_requests_total', event=event_name, outcome='success')
+        metrics.registry.inc('mottasl_events_delivered_total', len(event_ids), event=event_name)
+        circuit.record_success()
+        _logger.info("Sent %s to Mottasl: %s events, %s bytes, %dms, HTTP %s",
+                     event_name, len(event_ids), size, latency * 1000, response.status_code)
+        if logs.sample(_logger, config.log_sample_rate):
+            _logger.debug("Mottasl response to %s: %s", event_name, response.text)
+        results.append((event_ids, None, None))
+    return results
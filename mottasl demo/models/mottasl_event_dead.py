@@ -0,0 +1,71 @@
+import logging
+
+from odoo import api, fields, models
+from odoo.tools import split_every
+
+_logger = logging.getLogger(__name__)
+
+REPLAY_BATCH_SIZE = 1000
+
+
+class MottaslEventDead(models.Model):
+    """Events Mottasl rejected or that ran out of delivery attempts."""
+    _name = 'mottasl.event.dead'
+    _description = 'Mottasl Dead Letter Event'
+    _order = 'id desc'
+
+    name = fields.Char(string='Event', required=True, index=True, readonly=True)
+    res_model = fields.Char(string='Model', required=True, index=True, readonly=True)
+    res_id = fields.Integer(string='Record ID', readonly=True)
+    company_id = fields.Many2one('res.company', string='Company', readonly=True)
+    payload = fields.Text(required=True, readonly=True)
+    reason = fields.Text(readonly=True)
+    attempts = fields.Integer(readonly=True)
+    last_http_status = fields.Integer(string='Last HTTP Status', readonly=True)
+    event_date = fields.Datetime(string='Event Date', index=True, readonly=True,
+                                 help="Date the event was first queued")
+
+    def action_replay(self):
+        """Queue the selected events again, used by the list action."""
+        count = self._replay()
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'type': 'success',
+                'message': f"{count} events queued for delivery.",
+                'next': {'type': 'ir.actions.client', 'tag': 'soft_reload'},
+            },
+        }
+
+    def _replay(self, batch_size=REPLAY_BATCH_SIZE):
+        """Move ``self`` back to the outbox, ``batch_size`` events at a time."""
+        count = 0
+        for ids in split_every(batch_size, self.ids):
+            count += self.browse(ids)._replay_batch()
+        return count
+
+    @api.model
+    def _replay_domain(self, domain, batch_size=REPLAY_BATCH_SIZE):
+        """Move the dead letters matching ``domain`` back to the outbox
+        without loading them all in memory."""
+        count = 0
+        while True:
+            dead = self.search(domain, order='id', limit=batch_size)
+            if not dead:
+                return count
+            count += dead._replay_batch()
+
+    def _replay_batch(self):
+        self.env['mottasl.event']._enqueue([{
+            'name': dead.name,
+            'res_model': dead.res_model,
+            'res_id': dead.res_id,
+            'company_id': dead.company_id.id,
+            'payload': dead.payload,
+        } for dead in self])
+        count = len(self)
+        _logger.info("Replaying %s Mottasl dead letter events", count)
+        self.unlink()
+        self.env.invalidate_all()
+        return count
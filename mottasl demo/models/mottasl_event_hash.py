@@ -0,0 +1,44 @@
+from odoo import api, fields, models
+
+
+class MottaslEventHash(models.Model):
+    """Content hash of the last event delivered for each record and event,
+    used to drop events identical to what Mottasl already received."""
+    _name = 'mottasl.event.hash'
+    _description = 'Mottasl Last Delivered Event Hash'
+    _log_access = False
+
+    res_model = fields.Char(string='Model', required=True)
+    res_id = fields.Integer(string='Record ID', required=True)
+    name = fields.Char(string='Event', required=True)
+    content_hash = fields.Char(required=True)
+
+    _sql_constraints = [
+        # also the index of the lookups by key
+        ('key_uniq', 'unique(res_model, res_id, name)', "A record has one last hash per event."),
+    ]
+
+    @api.model
+    def _get_hashes(self, keys):
+        """Return ``{(res_model, res_id, name): content_hash}`` for ``keys``."""
+        if not keys:
+            return {}
+        self.env.cr.execute("""
+            SELECT res_model, res_id, name, content_hash
+              FROM mottasl_event_hash
+             WHERE (res_model, res_id, name) IN %s
+        """, [tuple(keys)])
+        return {(res_model, res_id, name): content_hash for res_model, res_id, name, content_hash in self.env.cr.fetchall()}
+
+    @api.model
+    def _set_hashes(self, hashes):
+        """Record ``{(res_model, res_id, name): content_hash}`` as delivered."""
+        if not hashes:
+            return
+        self.env.cr.execute("""
+            INSERT INTO mottasl_event_hash (res_model, res_id, name, content_hash)
+                 VALUES %s
+            ON CONFLICT (res_model, res_id, name) DO UPDATE SET content_hash = EXCLUDED.content_hash
+        """ % ', '.join(['(%s, %s, %s, %s)'] * len(hashes)), [
+            value for key, content_hash in hashes.items() for value in (*key, content_hash)
+        ])
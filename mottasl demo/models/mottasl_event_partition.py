@@ -0,0 +1,57 @@
+from odoo import api, fields, models
+
+
+class MottaslEventPartition(models.Model):
+    """Partition of the outbox, claimed by one dispatch worker at a time.
+
+    Events belong to partition ``partition_hash % total``; a worker holds the
+    row of the partition it delivers locked until its transaction ends, so
+    that the events of a record are never sent by two workers at once.
+    """
+    _name = 'mottasl.event.partition'
+    _description = 'Mottasl Outbox Partition'
+    _order = 'number'
+    _log_access = False
+
+    number = fields.Integer(required=True)
+    total = fields.Integer(required=True, help="Number of partitions when this one was created")
+    claim_date = fields.Datetime(help="Last time a worker claimed the partition, the least recent is claimed first")
+
+    @api.model
+    def _claim(self, total, exclude=()):
+        """Lock a partition no other worker holds, skipping ``exclude``, and
+        return its ``(number, total)``, or ``None`` when all are taken."""
+        self._sync(total)
+        self.env.cr.execute("""
+            SELECT number, total
+              FROM mottasl_event_partition
+             WHERE NOT (number = ANY(%s::int[]))
+          ORDER BY claim_date NULLS FIRST, number
+             LIMIT 1
+               FOR UPDATE SKIP LOCKED
+        """, [list(exclude)])
+        row = self.env.cr.fetchone()
+        if row:
+            self.env.cr.execute("""
+                UPDATE mottasl_event_partition SET claim_date = (now() at time zone 'UTC') WHERE number = %s
+            """, [row[0]])
+        return row
+
+    @api.model
+    def _sync(self, total):
+        """Recreate the partitions when their number changed. The table lock
+        waits for the workers holding the old ones, and workers still looking
+        at the old rows fail to lock them, so two partitionings never deliver
+        at the same time."""
+        self.env.cr.execute("SELECT total FROM mottasl_event_partition LIMIT 1")
+        row = self.env.cr.fetchone()
+        if row and row[0] == total:
+            return
+        self.env.cr.execute("LOCK TABLE mottasl_event_partition IN EXCLUSIVE MODE")
+        self.env.cr.execute("SELECT COUNT(*) FROM mottasl_event_partition WHERE total = %s", [total])
+        if self.env.cr.fetchone()[0] == total:
+            return
+        self.env.cr.execute("DELETE FROM mottasl_event_partition")
+        self.env.cr.execute("""
+            INSERT INTO mottasl_event_partition (number, total) SELECT number, %s FROM generate_series(0, %s) number
+        """, [total, total - 1])
@@ -0,0 +1,161 @@
+import base64
+import logging
+import secrets
+import threading
+import time
+
+from odoo import api, fields, models, tools
+
+_logger = logging.getLogger(__name__)
+
+INVOICE_REPORT = 'account.report_invoice_with_payments'
+DEFAULT_PDF_RENDER_TIME_BUDGET = 60
+# seconds a click waits before retrying while another request renders the first PDF
+PDF_RENDER_RETRY_AFTER = 5
+# seconds clients and proxies may reuse a PDF before revalidating its ETag
+PDF_CACHE_MAX_AGE = 300
+
+
+class MottaslInvoicePdf(models.Model):
+    """PDF of an invoice linked from the Mottasl events, rendered ahead of
+    the clicks.
+
+    The link sent in the events carries a per-invoice token and stays valid
+    for the life of the invoice. Live events create the entry, and render
+    its PDF, ahead of the clicks; backfilled invoices only get one on their
+    first click, their token being derived from the database secret. The cached PDF is keyed by the ``write_date``
+    of the invoice it was rendered from: any update of the invoice makes it
+    stale, and the render cron, or the first click if it comes first,
+    replaces it.
+    """
+    _name = 'mottasl.invoice.pdf'
+    _description = 'Mottasl Invoice PDF'
+
+    move_id = fields.Many2one('account.move', string='Invoice', required=True, ondelete='cascade', index=True)
+    token = fields.Char(required=True, copy=False, default=lambda self: secrets.token_urlsafe(32))
+    pdf = fields.Binary(string='PDF', attachment=True)
+    rendered_write_date = fields.Datetime(help="Last update of the invoice when its PDF was rendered")
+
+    _sql_constraints = [
+        ('move_uniq', 'unique(move_id)', "An invoice has a single cached PDF."),
+    ]
+
+    @api.model
+    def _get_token(self, move_id):
+        """Return the token of the link of invoice ``move_id`` when it has no
+        entry yet, the same in every transaction."""
+        return tools.hmac(self.env(su=True), 'mottasl-invoice-pdf', move_id)
+
+    @api.model
+    def _get_tokens(self, moves, eager=True):
+        """Return ``{move_id: token}`` for ``moves``. When ``eager``, the
+        missing entries are created and their PDF is rendered once the
+        invoice is posted; otherwise they are left to the first click."""
+        entries = self.sudo().search([('move_id', 'in', moves.ids)])
+        tokens = {entry.move_id.id: entry.token for entry in entries}
+        missing = [move_id for move_id in moves.ids if move_id not in tokens]
+        if not eager:
+            tokens.update((move_id, self._get_token(move_id)) for move_id in missing)
+            return tokens
+        if missing:
+            entries = self.sudo().create([{'move_id': move_id, 'token': self._get_token(move_id)} for move_id in missing])
+            tokens.update((entry.move_id.id, entry.token) for entry in entries)
+        if moves:
+            # new invoices and updated ones, whose PDF is stale now
+            self._trigger_render()
+        return tokens
+
+    @api.model
+    def _trigger_render(self):
+        data = self.env.cr.precommit.data
+        if data.get('mottasl.pdf_render_triggered'):
+            return
+        data['mottasl.pdf_render_triggered'] = True
+        cron = self.env.ref(f'{self._module}.ir_cron_mottasl_invoice_pdf', raise_if_not_found=False)
+        if cron:
+            cron.sudo()._trigger()
+
+    def _is_fresh(self):
+        self.ensure_one()
+        # compared in SQL: the ORM drops the microseconds of write_date, and
+        # an update within the same second must make the PDF stale
+        self.env.flush_all()
+        self.env.cr.execute("""
+            SELECT pdf.rendered_write_date = move.write_date
+              FROM mottasl_invoice_pdf pdf
+              JOIN account_move move ON move.id = pdf.move_id
+             WHERE pdf.id = %s
+        """, [self.id])
+        row = self.env.cr.fetchone()
+        return bool(row and row[0]) and bool(self.with_context(bin_size=True).pdf)
+
+    def _lock_for_render(self):
+        """Lock the entry until the end of the transaction and return whether
+        it was free: a single request or cron renders a given PDF at a time."""
+        self.ensure_one()
+        self.env.cr.execute(
+            "SELECT id FROM mottasl_invoice_pdf WHERE id = %s FOR UPDATE SKIP LOCKED", [self.id],
+        )
+        return bool(self.env.cr.fetchone())
+
+    def _render(self):
+        self.env.flush_all()
+        for entry in self:
+            # the exact write_date, read before rendering: an update committed
+            # meanwhile leaves the PDF stale
+            self.env.cr.execute("SELECT write_date FROM account_move WHERE id = %s", [entry.move_id.id])
+            write_date = self.env.cr.fetchone()[0]
+            content, _content_type = self.env['ir.actions.report'].sudo()._render_qweb_pdf(
+                INVOICE_REPORT, res_ids=entry.move_id.ids,
+            )
+            entry.write({'pdf': base64.b64encode(content)})
+            # through SQL, the ORM would drop the microseconds
+            self.env.cr.execute(
+                "UPDATE mottasl_invoice_pdf SET rendered_write_date = %s WHERE id = %s", [write_date, entry.id],
+            )
+            entry.invalidate_recordset(['rendered_write_date'])
+
+    @api.model
+    def _get_stale(self, limit):
+        """Return the entries of posted invoices without an up to date PDF."""
+        self.env.flush_all()
+        self.env.cr.execute("""
+            SELECT pdf.id
+              FROM mottasl_invoice_pdf pdf
+              JOIN account_move move ON move.id = pdf.move_id
+             WHERE move.state = 'posted'
+               AND (pdf.rendered_write_date IS NULL
+                    OR pdf.rendered_write_date != move.write_date)
+          ORDER BY pdf.id
+             LIMIT %s
+        """, [limit])
+        return self.browse(row[0] for row in self.env.cr.fetchall())
+
+    @api.model
+    def _cron_render(self, batch_size=20):
+        get_param = self.env['ir.config_parameter'].sudo().get_param
+        deadline = time.monotonic() + int(get_param('mottasl.pdf_render_time_budget', DEFAULT_PDF_RENDER_TIME_BUDGET))
+        testing = getattr(threading.current_thread(), 'testing', False)
+        skipped = set()
+        while time.monotonic() < deadline:
+            entries = self._get_stale(batch_size + len(skipped)).filtered(lambda entry: entry.id not in skipped)
+            if not entries:
+                return
+            for entry in entries:
+                if not entry._lock_for_render():
+                    # being rendered by a click
+                    skipped.add(entry.id)
+                    continue
+                try:
+                    with self.env.cr.savepoint():
+                        entry._render()
+                except Exception:
+                    # served by an on-demand render meanwhile, retried by the next run
+                    _logger.exception("Failed to render the PDF of invoice %s", entry.move_id.id)
+                    skipped.add(entry.id)
+                if not testing:
+                    self.env.cr.commit()
+                if time.monotonic() >= deadline:
+                    break
+            self.env.invalidate_all()
+        self.env.ref(f'{self._module}.ir_cron_mottasl_invoice_pdf').sudo()._trigger()
@@ -0,0 +1,67 @@
+import logging
+
+from odoo import api, fields, models
+
+from ..tools import metrics
+
+_logger = logging.getLogger(__name__)
+
+
+class MottaslMetric(models.Model):
+    """Samples of the Mottasl metrics, summed over all the worker processes.
+
+    Every process adds what it recorded since its last flush at most every
+    ``metrics.FLUSH_INTERVAL`` seconds, so the route answering a scrape
+    sees the deliveries of the cron workers and the counters do not reset
+    when a worker is recycled.
+    """
+    _name = 'mottasl.metric'
+    _description = 'Mottasl Metric Sample'
+    _order = 'metric, id'
+    _log_access = False
+
+    metric = fields.Char(required=True)
+    kind = fields.Char(required=True, help="Prometheus type of the metric")
+    sample = fields.Char(required=True, help="Name of the sample, with the _bucket, _sum or _count suffix of histograms")
+    labels = fields.Char(help="Formatted labels of the sample")
+    value = fields.Float(required=True)
+
+    _sql_constraints = [
+        ('sample_uniq', 'unique(sample, labels)', "A sample is stored once per set of labels."),
+    ]
+
+    @api.model
+    def _flush(self):
+        """Add the metrics of this process to the table, in a transaction of
+        its own so that they are kept whatever happens to the current one."""
+        samples = sorted(metrics.registry.drain(), key=lambda sample: (sample[2], sample[3]))  # fixed lock order
+        if not samples:
+            return
+        try:
+            with self.env.registry.cursor() as cr:
+                cr.execute("""
+                    INSERT INTO mottasl_metric (metric, kind, sample, labels, value)
+                         VALUES %s
+                    ON CONFLICT (sample, labels) DO UPDATE SET value = mottasl_metric.value + EXCLUDED.value
+                """ % ', '.join(['(%s, %s, %s, %s, %s)'] * len(samples)), [
+                    value for sample in samples for value in sample
+                ])
+        except Exception:
+            # metrics must never break the operation that recorded them
+            _logger.warning("Failed to flush %s Mottasl metric samples", len(samples), exc_info=True)
+
+    @api.model
+    def _flush_after_commit(self):
+        """Flush the metrics of this process once the current transaction
+        commits, if the last flush is old enough."""
+        data = self.env.cr.postcommit.data
+        if data.get('mottasl.metrics_flush') or not metrics.registry.flush_due():
+            return
+        data['mottasl.metrics_flush'] = True
+        self.env.cr.postcommit.add(self._flush)
+
+    @api.model
+    def _get_samples(self):
+        """Return the stored samples, as expected by ``metrics.render()``."""
+        self.env.cr.execute("SELECT metric, kind, sample, COALESCE(labels, ''), value FROM mottasl_metric ORDER BY metric, id")
+        return self.env.cr.fetchall()
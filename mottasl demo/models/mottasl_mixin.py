@@ -0,0 +1,255 @@
+import ast
+import logging
+from collections import defaultdict
+from datetime import datetime
+
+from odoo import SUPERUSER_ID, api, models, tools
+
+from ..tools import logs, metrics
+
+_logger = logging.getLogger(__name__)
+
+# bookkeeping fields that change on every write and mean nothing to subscribers
+MOTTASL_DIFF_IGNORED = frozenset(('id', 'write_date', 'write_uid'))
+# ORM method in which each kind of event is collected, for the metrics
+ORM_OPERATIONS = {'create': 'create', 'update': 'write', 'delete': 'unlink'}
+
+
+class MottaslEventMixin(models.AbstractModel):
+    """Shared helpers for the models that publish events to Mottasl."""
+    _name = 'mottasl.event.mixin'
+    _description = 'Mottasl Event Mixin'
+
+    # Fields sent in the event ``data``. The system parameter
+    # ``mottasl.fields.<model>`` (comma separated) overrides this list.
+    _mottasl_fields = ()
+    # Domains the records must match for each event to be sent, by event
+    # name. The system parameter ``mottasl.filter.<event>`` overrides them.
+    _mottasl_filters = {}
+    # Event sent for the existing records by a backfill
+    _mottasl_backfill_event = None
+
+    @api.model
+    @tools.ormcache()
+    def _mottasl_get_fields(self):
+        """Return the projected field names, binary fields excluded."""
+        param = self.env['ir.config_parameter'].sudo().get_param(f'mottasl.fields.{self._name}')
+        names = [name.strip() for name in param.split(',')] if param else self._mottasl_fields
+        return tuple(
+            name for name in names
+            if name in self._fields and self._fields[name].type != 'binary'
+        ) or ('display_name',)
+
+    @api.model
+    @tools.ormcache('event')
+    def _mottasl_get_filter(self, event):
+        """Return the domain of the records for which ``event`` is sent."""
+        param = self.env['ir.config_parameter'].sudo().get_param(f'mottasl.filter.{event}')
+        domain = self._mottasl_filters.get(event, [])
+        if param:
+            try:
+                domain = ast.literal_eval(param)
+            except (ValueError, SyntaxError):
+                _logger.error("Invalid domain in mottasl.filter.%s, using the default one: %s", event, param)
+        return tuple(tuple(leaf) if isinstance(leaf, list) else leaf for leaf in domain)
+
+    def _mottasl_filter(self, event):
+        """Return the records of ``self`` for which ``event`` is sent, in one
+        query and before anything is read for the payloads."""
+        domain = self._mottasl_get_filter(event)
+        if not domain or not self:
+            return self
+        # sudo: the filter is a configuration of the module, not of the user
+        return self.browse(self.sudo().with_context(active_test=False).search(
+            [('id', 'in', self.ids), *domain], order='id',
+        ).ids)
+
+    def _mottasl_read(self):
+        """Read the projected fields of the whole recordset at once, keyed by
+        id."""
+        rows = self.read(list(self._mottasl_get_fields()))
+        return {values['id']: values for values in rows}
+
+    @api.model
+    @tools.ormcache()
+    def _mottasl_get_trigger_fields(self):
+        """Return the fields whose modification may change the projected data:
+        the projected fields themselves and, transitively, the fields their
+        computation depends on."""
+        triggers = set()
+        todo = list(self._mottasl_get_fields())
+        while todo:
+            name = todo.pop()
+            if name in triggers or name not in self._fields:
+                continue
+            triggers.add(name)
+            depends, _depends_context = self._fields[name].get_depends(self)
+            todo.extend(path.split('.')[0] for path in depends)
+        return frozenset(triggers)
+
+    def _mottasl_snapshot(self, vals):
+        """Return the projected data of ``self`` before ``vals`` is written, or
+        ``None`` when the write cannot change anything subscribers receive."""
+        if not self.env['mottasl.event']._get_config():
+            return None
+        with metrics.registry.timer('mottasl_orm_overhead_seconds', model=self._name, operation='write'):
+            triggers = self._mottasl_get_trigger_fields()
+            if not any(
+                name in triggers or self._fields[name].type in ('one2many', 'many2many')
+                for name in vals if name in self._fields
+            ):
+                return None
+            # records already collected in this transaction keep their first state
+            data = self.env.cr.precommit.data
+            pending = data.get('mottasl.pending', {})
+            bulk = data.get('mottasl.bulk', {}).get(self._name, {})
+            records = self.filtered(lambda record: (self._name, record.id) not in pending and record.id not in bulk)
+            # read like at commit, so that translated names compare equal
+            return records.with_env(self._mottasl_env())._mottasl_read() if records else {}
+
+    def _mottasl_read_delete_data(self, event, extra_fields=()):
+        """Return the data of the delete ``event`` of ``self``, keyed by id, or
+        ``None`` when Mottasl is not configured. Must be called before the
+        records are deleted, so that the event filter can still be evaluated;
+        costs one read of ``self`` and one of the partners.
+        """
+        if not self.env['mottasl.event']._get_config():
+            return None
+        with metrics.registry.timer('mottasl_orm_overhead_seconds', model=self._name, operation='unlink'):
+            deletion_date = datetime.now().isoformat()
+            records = self._mottasl_filter(event).read(['partner_id', 'company_id', *extra_fields])
+            partner_ids = {record['partner_id'][0] for record in records if record['partner_id']}
+            phones = {
+                partner['id']: partner['phone'] or partner['mobile']
+                for partner in self.env['res.partner'].browse(partner_ids).read(['phone', 'mobile'])
+            }
+            return {
+                record['id']: {
+                    **{name: record[name] for name in extra_fields},
+                    'id': record['id'],
+                    'company_id': record['company_id'] and record['company_id'][0],
+                    'customer_phone': phones.get(record['partner_id'] and record['partner_id'][0]) or 'N/A',
+                    'deletion_date': deletion_date,
+                }
+                for record in records
+            }
+
+    def _mottasl_is_bulk(self, count):
+        """Return whether creating ``count`` records at once runs in bulk
+        import mode: for imports from files, when the ``mottasl_bulk_import``
+        context key is set, or from ``mottasl.bulk_threshold`` records."""
+        config = self.env['mottasl.event']._get_config()
+        if not config:
+            return False
+        context = self.env.context
+        return bool(context.get('mottasl_bulk_import') or context.get('import_file') or count >= config.bulk[0])
+
+    def _mottasl_log_sample(self, logger):
+        """Return whether to log the full values created or written on
+        ``self`` to ``logger``: at DEBUG level, for a sample of the calls."""
+        if not logger.isEnabledFor(logging.DEBUG):
+            return False
+        config = self.env['mottasl.event']._get_config()
+        return bool(config) and logs.sample(logger, config.log_sample_rate)
+
+    def _mottasl_collect(self, kind, event, values=None):
+        """Collect a ``create``, ``update`` or ``delete`` event for ``self``.
+
+        Events are coalesced per record until the transaction commits: updates
+        of a record created in the same transaction are folded into its create,
+        a create followed by a delete sends nothing, and successive updates
+        are diffed against the state before the first one.
+
+        Creates in bulk import mode (see :meth:`_mottasl_is_bulk`) only record
+        the ids, their events are sent at commit in a few batch envelopes.
+
+        :param values: dict mapping record ids to their update snapshot or to
+            the data read before deletion
+        """
+        if not self.env['mottasl.event']._get_config():
+            return
+        with metrics.registry.timer('mottasl_orm_overhead_seconds', model=self._name, operation=ORM_OPERATIONS[kind]):
+            data = self.env.cr.precommit.data
+            pending = data.get('mottasl.pending')
+            if pending is None:
+                pending = data['mottasl.pending'] = {}
+                data['mottasl.bulk'] = defaultdict(dict)
+                self.env.cr.precommit.add(self.env['mottasl.event.mixin']._mottasl_flush)
+            bulk = data['mottasl.bulk'][self._name]
+            if kind == 'create' and self._mottasl_is_bulk(len(self)):
+                bulk.update(dict.fromkeys(self.ids, event))
+                return
+            values = values or {}
+            for record_id in self.ids:
+                if record_id in bulk:
+                    # created in bulk in this transaction, sent as created at commit
+                    if kind == 'delete':
+                        del bulk[record_id]
+                    continue
+                key = (self._name, record_id)
+                if kind == 'delete' and record_id not in values:
+                    # out of the filter of the delete event, nothing to send
+                    pending.pop(key, None)
+                    continue
+                entry = pending.get(key)
+                if entry is None:
+                    pending[key] = {'kind': kind, 'event': event, 'values': values.get(record_id)}
+                elif kind == 'delete':
+                    if entry['kind'] == 'create':
+                        del pending[key]
+                    else:
+                        pending[key] = {'kind': kind, 'event': event, 'values': values.get(record_id)}
+
+    def _mottasl_env(self):
+        """Return the environment the projected data is read in: superuser
+        with an empty context. The flush hook is bound to the env of the first
+        record collected, whose user, companies, language and context have
+        nothing to do with the other records of the transaction, and the
+        update snapshots must be read the same way to be diffed."""
+        return api.Environment(self.env.cr, SUPERUSER_ID, {})
+
+    @api.model
+    def _mottasl_flush(self):
+        """Turn the events collected during the transaction into outbox rows."""
+        env = self._mottasl_env()
+        pending = env.cr.precommit.data.pop('mottasl.pending', {})
+        bulk = env.cr.precommit.data.pop('mottasl.bulk', {})
+        for model_name, record_events in bulk.items():
+            ids_by_event = defaultdict(list)
+            for record_id, event in record_events.items():
+                ids_by_event[event].append(record_id)
+            model = env[model_name].with_context(mottasl_bulk_enqueue=True)
+            for event, ids in ids_by_event.items():
+                with metrics.registry.timer('mottasl_orm_overhead_seconds', model=model_name, operation='commit'):
+                    records = model.browse(ids)._mottasl_filter(event).exists()
+                    model._mottasl_send_data(records, event)
+        groups = defaultdict(dict)
+        for (model_name, record_id), entry in pending.items():
+            groups[model_name, entry['kind'], entry['event']][record_id] = entry['values']
+        for (model_name, kind, event), values in groups.items():
+            model = env[model_name]
+            with metrics.registry.timer('mottasl_orm_overhead_seconds', model=model_name, operation='commit'):
+                if kind == 'delete':
+                    model._send_delete_action(list(values.values()))
+                else:
+                    # also drops the records gone with a rolled back savepoint
+                    records = model.browse(list(values))._mottasl_filter(event).exists()
+                    model._mottasl_send_data(records, event, snapshot=values if kind == 'update' else None)
+
+    def _mottasl_send_data(self, records, event, snapshot=None):
+        """Queue the create or update ``event`` of ``records``."""
+        raise NotImplementedError()
+
+    def _send_delete_action(self, records):
+        """Queue the delete events of ``records``, as returned by
+        :meth:`_mottasl_read_delete_data`."""
+        raise NotImplementedError()
+
+    @api.model
+    def _mottasl_diff(self, old_values, new_values):
+        """Return ``{field: {'old': ..., 'new': ...}}`` for the fields that changed."""
+        return {
+            name: {'old': old_values.get(name), 'new': value}
+            for name, value in new_values.items()
+            if name not in MOTTASL_DIFF_IGNORED and old_values.get(name) != value
+        }
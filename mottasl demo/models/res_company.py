@@ -0,0 +1,23 @@
+from odoo import fields, models
+
+
+class ResCompany(models.Model):
+    _inherit = 'res.company'
+
+    mottasl_api_key = fields.Char(
+        string='Mottasl API Key',
+        groups='base.group_system',
+        help='Mottasl account receiving the events of this company, the default one if empty',
+    )
+    mottasl_endpoint_url = fields.Char(
+        string='Mottasl Endpoint',
+        groups='base.group_system',
+        help='Events endpoint of the Mottasl account of this company, the default one if empty',
+    )
+
+    def write(self, vals):
+        result = super().write(vals)
+        if {'mottasl_api_key', 'mottasl_endpoint_url'} & vals.keys():
+            # drop the cached Mottasl configuration and destinations
+            self.env.registry.clear_cache()
+        return result
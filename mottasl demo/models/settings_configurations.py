@@ -5,10 +5,85 @@ class ResConfigSettings(models.TransientModel):
     mottasl_api_key = fields.Char(
         string='Mottasl API Key',
         config_parameter='mottasl_api_key',
-        help='Mottasl API Key related to your mottasl account',
+        help='Mottasl API Key related to your mottasl account, used for the companies without their own',
         size=36,
         default= 'Enter your api key here',
-        required=True
+    )
+    mottasl_company_api_key = fields.Char(
+        related='company_id.mottasl_api_key',
+        readonly=False,
+    )
+    mottasl_company_endpoint_url = fields.Char(
+        related='company_id.mottasl_endpoint_url',
+        readonly=False,
+    )
+    mottasl_batch_enabled = fields.Boolean(
+        string='Batch Delivery',
+        config_parameter='mottasl.batch_enabled',
+        help='Pack several events into a single request to Mottasl',
+    )
+    mottasl_batch_max_events = fields.Integer(
+        string='Max Events per Batch',
+        config_parameter='mottasl.batch_max_events',
+        default=100,
+    )
+    mottasl_batch_max_bytes = fields.Integer(
+        string='Max Batch Size (bytes)',
+        config_parameter='mottasl.batch_max_bytes',
+        default=1024 * 1024,
+    )
+    mottasl_batch_max_age = fields.Integer(
+        string='Max Batch Age (seconds)',
+        config_parameter='mottasl.batch_max_age',
+        default=30,
+        help='A batch that is not full is sent once its oldest event reaches this age',
+    )
+    mottasl_bulk_threshold = fields.Integer(
+        string='Bulk Import Threshold',
+        config_parameter='mottasl.bulk_threshold',
+        default=1000,
+        help='Records created at once from which their events are sent in a few large batches at commit, '
+             'imports from files always are',
+    )
+    mottasl_bulk_batch_size = fields.Integer(
+        string='Events per Bulk Batch',
+        config_parameter='mottasl.bulk_batch_size',
+        default=1000,
+    )
+    mottasl_connect_timeout = fields.Float(
+        string='Connect Timeout (seconds)',
+        config_parameter='mottasl.connect_timeout',
+        default=5,
+    )
+    mottasl_read_timeout = fields.Float(
+        string='Read Timeout (seconds)',
+        config_parameter='mottasl.read_timeout',
+        default=30,
+    )
+    mottasl_pool_size = fields.Integer(
+        string='Connection Pool Size',
+        config_parameter='mottasl.pool_size',
+        default=10,
+        help='Keep-alive connections kept open to each Mottasl endpoint by each worker process',
+    )
+    mottasl_dispatch_concurrency = fields.Integer(
+        string='Concurrent Requests',
+        config_parameter='mottasl.dispatch_concurrency',
+        default=4,
+        help='Maximum number of requests sent in parallel to each Mottasl account, '
+             'events of the same record are always sent in order',
+    )
+    mottasl_dispatch_workers = fields.Integer(
+        string='Dispatch Workers',
+        config_parameter='mottasl.dispatch_workers',
+        default=1,
+        help='Crons delivering events in parallel, on as many Odoo worker processes or nodes; '
+             'events of the same record are always sent by one of them at a time',
+    )
+    mottasl_compression = fields.Boolean(
+        string='Compress Requests',
+        config_parameter='mottasl.compression',
+        help='Gzip request bodies sent to Mottasl',
     )
 
     @api.model
@@ -17,4 +92,8 @@ class ResConfigSettings(models.TransientModel):
         res['mottasl_api_key'] = self.env['ir.config_parameter'].sudo().get_param('mottasl_api_key', default='')
         return res
 
-
+    def set_values(self):
+        super(ResConfigSettings, self).set_values()
+        # drop the cached Mottasl configuration
+        self.env.registry.clear_cache()
+        self.env['mottasl.event'].sudo()._sync_dispatch_workers()
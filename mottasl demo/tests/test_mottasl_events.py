@@ -0,0 +1,167 @@
+import json
+from unittest.mock import MagicMock, patch
+
+import requests
+
+from odoo.addons.account.tests.common import AccountTestInvoicingCommon
+from odoo.tests import tagged
+
+from ..models.mottasl_event import MAX_ATTEMPTS
+from ..tools import transport
+
+
+@tagged('post_install', '-at_install')
+class TestMottaslEvents(AccountTestInvoicingCommon):
+
+    @classmethod
+    def setUpClass(cls, chart_template_ref=None):
+        super().setUpClass(chart_template_ref=chart_template_ref)
+        cls.env['ir.config_parameter'].sudo().set_param('mottasl_api_key', 'test-key')
+        cls.env.registry.clear_cache()
+        cls.Event = cls.env['mottasl.event'].sudo()
+
+    def _commit_events(self):
+        """Run the precommit hooks that turn the collected events into outbox rows."""
+        self.env.flush_all()
+        self.env.cr.precommit.run()
+
+    def _events(self, record):
+        return self.Event.search([('res_model', '=', record._name), ('res_id', '=', record.id)])
+
+    def _create_invoice(self):
+        """Return a customer invoice whose create event is already queued, and
+        clear the outbox."""
+        invoice = self.init_invoice('out_invoice', amounts=[100])
+        self._commit_events()
+        self.Event.search([]).unlink()
+        return invoice
+
+    def _dispatch(self, response=None, error=None):
+        """Run the dispatcher with Mottasl answering ``response`` or raising
+        ``error``, and return the mock of the requests sent."""
+        post = MagicMock(return_value=response or MagicMock(status_code=200, text='ok'), side_effect=error)
+        with patch.object(transport, 'post', post):
+            self.Event._cron_dispatch()
+        self.env.invalidate_all()
+        return post
+
+    def test_create_then_update_is_one_create(self):
+        invoice = self.init_invoice('out_invoice', amounts=[100])
+        invoice.write({'ref': 'Updated'})
+        self._commit_events()
+
+        events = self._events(invoice)
+        self.assertEqual(events.mapped('name'), ['invoice.create'])
+        self.assertEqual(json.loads(events.payload)['data']['ref'], 'Updated', "The create carries the final state")
+
+    def test_create_then_unlink_sends_nothing(self):
+        invoice = self.init_invoice('out_invoice', amounts=[100])
+        invoice_id = invoice.id
+        invoice.unlink()
+        self._commit_events()
+
+        self.assertFalse(self.Event.search([('res_model', '=', 'account.move'), ('res_id', '=', invoice_id)]))
+
+    def test_updates_diffed_against_first_snapshot(self):
+        invoice = self._create_invoice()
+        invoice.write({'ref': 'First'})
+        invoice.write({'ref': 'Second'})
+        self._commit_events()
+
+        events = self._events(invoice)
+        self.assertEqual(events.mapped('name'), ['invoice.update'])
+        data = json.loads(events.payload)['data']
+        self.assertEqual(data['changes']['ref'], {'old': False, 'new': 'Second'})
+        self.assertNotIn('write_date', data['changes'])
+
+    def test_update_without_relevant_change_sends_nothing(self):
+        invoice = self._create_invoice()
+        invoice.write({'ref': 'Temporary'})
+        invoice.write({'ref': False})  # back to the state before the transaction
+        invoice.write({'narration': 'Not sent to Mottasl'})
+        self._commit_events()
+
+        self.assertFalse(self._events(invoice))
+
+    def test_update_in_other_language_sends_nothing(self):
+        self.env['res.lang']._activate_lang('fr_FR')
+        stage = self.env['crm.stage'].create({'name': 'Qualified'})
+        stage.with_context(lang='fr_FR').name = 'Qualifié'
+        lead = self.env['crm.lead'].create({'name': 'Lead', 'stage_id': stage.id})
+        self._commit_events()
+        self.Event.search([]).unlink()
+
+        # the display name of the stage is translated, its value is the same
+        lead.with_user(self.env.user).with_context(lang='fr_FR').write({'name': 'Lead'})
+        self._commit_events()
+
+        self.assertFalse(self._events(lead))
+
+    def test_identical_event_not_sent_again(self):
+        invoice = self.init_invoice('out_invoice', amounts=[100])
+        self._commit_events()
+        event = self._events(invoice)
+        post = self._dispatch()
+        self.assertEqual(post.call_count, 1)
+        self.assertEqual(event.state, 'done')
+
+        copy = self.Event._enqueue([{
+            'name': event.name, 'res_model': event.res_model, 'res_id': event.res_id,
+            'company_id': event.company_id.id, 'payload': event.payload,
+        }])
+        post = self._dispatch()
+        post.assert_not_called()
+        self.assertEqual(copy.state, 'done', "Skipped as a duplicate of the delivered event")
+
+    def test_failed_event_retried_then_dead_lettered(self):
+        invoice = self.init_invoice('out_invoice', amounts=[100])
+        self._commit_events()
+        event = self._events(invoice)
+
+        self._dispatch(error=requests.exceptions.ConnectionError("unreachable"))
+        self.assertEqual(event.state, 'pending')
+        self.assertEqual(event.attempts, 1)
+        self.assertTrue(event.next_attempt_date, "The retry is scheduled")
+
+        event.write({'attempts': MAX_ATTEMPTS - 1, 'next_attempt_date': False})
+        self._dispatch(error=requests.exceptions.ConnectionError("unreachable"))
+        self.assertFalse(event.exists())
+        dead = self.env['mottasl.event.dead'].sudo().search([('res_model', '=', 'account.move'), ('res_id', '=', invoice.id)])
+        self.assertEqual(dead.attempts, MAX_ATTEMPTS)
+
+    def test_rejected_event_dead_lettered_at_once(self):
+        invoice = self.init_invoice('out_invoice', amounts=[100])
+        self._commit_events()
+        event = self._events(invoice)
+
+        self._dispatch(error=requests.exceptions.HTTPError("rejected", response=MagicMock(status_code=400)))
+        self.assertFalse(event.exists())
+        dead = self.env['mottasl.event.dead'].sudo().search([('res_model', '=', 'account.move'), ('res_id', '=', invoice.id)])
+        self.assertEqual(dead.last_http_status, 400)
+
+    def test_unlink_mixed_move_types(self):
+        invoice = self.init_invoice('out_invoice', amounts=[100])
+        moves = invoice | self.init_invoice('in_invoice', amounts=[100]) | self.init_invoice('out_refund', amounts=[100])
+        self._commit_events()
+        self.Event.search([]).unlink()
+
+        invoice_id = invoice.id
+        moves.unlink()
+        self._commit_events()
+
+        events = self.Event.search([])
+        self.assertEqual(events.mapped('name'), ['invoice.delete'], "Only the customer invoice is filtered in")
+        self.assertEqual(events.res_id, invoice_id)
+
+    def test_trigger_several_dispatch_workers(self):
+        self.env['ir.config_parameter'].sudo().set_param('mottasl.dispatch_workers', 2)
+        self.Event._sync_dispatch_workers()
+        crons = self.Event._get_dispatch_crons()
+        self.assertEqual(len(crons), 2)
+
+        self.init_invoice('out_invoice', amounts=[100])
+        self._commit_events()
+
+        self.assertTrue(self.Event.search([('name', '=', 'invoice.create')]))
+        triggers = self.env['ir.cron.trigger'].sudo().search([('cron_id', 'in', crons.ids)])
+        self.assertEqual(triggers.cron_id, crons, "Every dispatch worker is woken up")
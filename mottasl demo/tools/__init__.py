@@ -0,0 +1,5 @@
+from . import breaker
+from . import logs
+from . import metrics
+from . import serializer
+from . import transport
@@ -0,0 +1,81 @@
+"""Circuit breaker guarding the Mottasl endpoint.
+
+After ``failure_threshold`` consecutive failures the breaker opens and no
+request is attempted for ``reset_timeout`` seconds. It then lets a single
+probe through (half-open): a success closes it, a failure opens it again.
+State is kept per worker process.
+"""
+import threading
+import time
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+DEFAULT_FAILURE_THRESHOLD = 5
+DEFAULT_RESET_TIMEOUT = 60
+
+
+class CircuitBreaker:
+
+    def __init__(self, failure_threshold=DEFAULT_FAILURE_THRESHOLD, reset_timeout=DEFAULT_RESET_TIMEOUT):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self.probing = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return CLOSED
+        if time.monotonic() - self.opened_at < self.reset_timeout:
+            return OPEN
+        return HALF_OPEN
+
+    def retry_in(self):
+        """Return the number of seconds before a request may be attempted."""
+        if self.opened_at is None:
+            return 0
+        return max(self.reset_timeout - (time.monotonic() - self.opened_at), 0)
+
+    def allow(self):
+        """Return whether a request may be sent now; in half-open state only
+        one caller gets the probe."""
+        with self._lock:
+            state = self.state
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and not self.probing:
+                self.probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+            self.probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.probing or self.failures >= self.failure_threshold:
+                self.opened_at = time.monotonic()
+            self.probing = False
+
+
+_breakers = {}
+_breakers_lock = threading.Lock()
+
+
+def get_breaker(key, reset_timeout=DEFAULT_RESET_TIMEOUT):
+    """Return the breaker of the destination ``key``, shared by the threads
+    of the current process, with the given ``reset_timeout``."""
+    with _breakers_lock:
+        breaker = _breakers.get(key)
+        if breaker is None:
+            breaker = _breakers[key] = CircuitBreaker(reset_timeout=reset_timeout)
+        breaker.reset_timeout = reset_timeout
+        return breaker
@@ -0,0 +1,17 @@
+"""Logging of the Mottasl hot paths.
+
+By default only one-line summaries are logged. Full payloads are logged at
+DEBUG level, and only for a sample of them (``mottasl.log_payload_sample_rate``)
+so that debugging a busy database does not flood the logs; they are not
+even formatted when the logger would drop them.
+"""
+import logging
+import random
+
+DEFAULT_PAYLOAD_SAMPLE_RATE = 1.0
+
+
+def sample(logger, rate):
+    """Return whether to log a full payload to ``logger``, given the share
+    ``rate`` (between 0 and 1) of payloads to log."""
+    return logger.isEnabledFor(logging.DEBUG) and rate > 0 and (rate >= 1 or random.random() < rate)
@@ -0,0 +1,144 @@
+"""Counters and histograms of the Mottasl event pipeline.
+
+Each worker process records its metrics in memory and regularly adds them
+to the ``mottasl.metric`` table (see :meth:`Registry.drain`), which sums the
+samples of all the processes: HTTP workers, cron workers and other nodes.
+The ``/mottasl/metrics`` route renders that table in the Prometheus text
+exposition format. A process stopped between two flushes loses at most
+:data:`FLUSH_INTERVAL` seconds of its metrics.
+"""
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+SECONDS_BUCKETS = (0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+BYTES_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+# seconds between two flushes of the metrics of a process to the database
+FLUSH_INTERVAL = 10
+
+HELP = {
+    'mottasl_events_queued_total': 'Events written to the outbox',
+    'mottasl_events_delivered_total': 'Events accepted by Mottasl',
+    'mottasl_events_failed_total': 'Events whose delivery attempt failed',
+    'mottasl_events_deduplicated_total': 'Events not sent because Mottasl already received the same content',
+    'mottasl_http_requests_total': 'Requests sent to Mottasl by outcome',
+    'mottasl_http_request_seconds': 'Latency of the requests sent to Mottasl',
+    'mottasl_serialization_seconds': 'Time spent serializing an event payload',
+    'mottasl_payload_bytes': 'Size of the serialized event payloads',
+    'mottasl_orm_overhead_seconds': 'Time spent in Mottasl hooks of ORM create, write, unlink and commit',
+    'mottasl_queue_depth': 'Events waiting in the outbox',
+    'mottasl_dead_letters': 'Events kept in the dead letters',
+}
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_number(value):
+    value = float(value)
+    return str(int(value)) if value.is_integer() else repr(value)
+
+
+def _format_labels(labels):
+    if not labels:
+        return ''
+    return '{%s}' % ','.join(f'{key}="{_escape(value)}"' for key, value in labels)
+
+
+class Registry:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = defaultdict(float)
+        # (name, labels) -> [bucket counts..., sum, count]
+        self._histograms = {}
+        self._buckets = {}
+        self._flushed_at = time.monotonic()
+
+    def inc(self, name, amount=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] += amount
+
+    def observe(self, name, value, buckets=SECONDS_BUCKETS, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            series = self._histograms.get(key)
+            if series is None:
+                self._buckets.setdefault(name, buckets)
+                series = self._histograms[key] = [0] * (len(buckets) + 2)
+            for index, bound in enumerate(self._buckets[name]):
+                if value <= bound:
+                    series[index] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    @contextmanager
+    def timer(self, name, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(name, time.perf_counter() - start, **labels)
+
+    def flush_due(self):
+        """Return whether metrics were recorded and the last flush is older
+        than :data:`FLUSH_INTERVAL`."""
+        return bool(self._counters or self._histograms) and time.monotonic() - self._flushed_at >= FLUSH_INTERVAL
+
+    def drain(self):
+        """Return the samples recorded since the last call and reset them.
+
+        Samples are ``(metric, kind, sample, labels, value)`` tuples, with
+        the labels already formatted and histograms split into their
+        cumulative ``_bucket``, ``_sum`` and ``_count`` samples, so that the
+        samples of several processes add up.
+        """
+        with self._lock:
+            counters, self._counters = self._counters, defaultdict(float)
+            histograms, self._histograms = self._histograms, {}
+            self._flushed_at = time.monotonic()
+        samples = [
+            (name, 'counter', name, _format_labels(labels), value)
+            for (name, labels), value in counters.items()
+        ]
+        for (name, labels), series in histograms.items():
+            for bound, count in zip(self._buckets[name], series):
+                samples.append((name, 'histogram', f'{name}_bucket',
+                                _format_labels(labels + (('le', _format_number(bound)),)), count))
+            samples.append((name, 'histogram', f'{name}_bucket', _format_labels(labels + (('le', '+Inf'),)), series[-1]))
+            samples.append((name, 'histogram', f'{name}_sum', _format_labels(labels), series[-2]))
+            samples.append((name, 'histogram', f'{name}_count', _format_labels(labels), series[-1]))
+        return samples
+
+
+def render(samples, gauges=()):
+    """Return the metrics in the Prometheus text format.
+
+    :param samples: ``(metric, kind, sample, labels, value)`` tuples as
+        returned by :meth:`Registry.drain`, those of a metric together
+    :param gauges: extra ``(name, labels_dict, value)`` samples computed
+        by the caller, e.g. the queue depth
+    """
+    lines = []
+    seen = set()
+
+    def header(name, kind):
+        if name not in seen:
+            seen.add(name)
+            if name in HELP:
+                lines.append(f'# HELP {name} {HELP[name]}')
+            lines.append(f'# TYPE {name} {kind}')
+
+    for metric, kind, sample, labels, value in samples:
+        header(metric, kind)
+        lines.append(f'{sample}{labels} {_format_number(value)}')
+    for name, labels, value in gauges:
+        header(name, 'gauge')
+        lines.append(f'{name}{_format_labels(tuple(sorted(labels.items())))} {_format_number(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+registry = Registry()
@@ -0,0 +1,80 @@
+"""HTTP transport shared by every Mottasl sender of a worker process.
+
+A single :class:`requests.Session` keeps TLS connections to the Mottasl
+endpoints alive between events instead of opening a new one per request.
+"""
+import gzip
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from . import serializer
+
+DEFAULT_CONNECT_TIMEOUT = 5
+DEFAULT_READ_TIMEOUT = 30
+DEFAULT_POOL_SIZE = 10
+DEFAULT_POOL_HOSTS = 1
+# smaller bodies are not worth the compression CPU
+COMPRESS_MIN_BYTES = 1024
+
+_lock = threading.Lock()
+_session = None
+_session_key = None
+
+
+def get_session(pool_size=DEFAULT_POOL_SIZE, pool_hosts=DEFAULT_POOL_HOSTS):
+    """Return the session of the current process, creating it on first use.
+
+    The session keeps up to ``pool_size`` connections to each of
+    ``pool_hosts`` hosts, so that the endpoints of several Mottasl accounts
+    do not evict each other's connections. It is recreated when these
+    change, and the pid is checked so that a prefork worker never reuses
+    sockets opened by its parent.
+    """
+    global _session, _session_key
+    key = (os.getpid(), pool_size, pool_hosts)
+    if _session is None or _session_key != key:
+        with _lock:
+            if _session is None or _session_key != key:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=pool_hosts, pool_maxsize=pool_size, max_retries=0)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({
+                    'Content-Type': 'application/json',
+                    'Accept-Encoding': 'gzip, deflate',
+                })
+                _session, _session_key = session, key
+    return _session
+
+
+def post(url, data, headers=None, connect_timeout=DEFAULT_CONNECT_TIMEOUT,
+         read_timeout=DEFAULT_READ_TIMEOUT, compress=False, pool_size=DEFAULT_POOL_SIZE,
+         pool_hosts=DEFAULT_POOL_HOSTS):
+    """POST ``data`` to ``url`` and return the response.
+
+    :param data: str, bytes or an iterable of byte chunks, joined into a
+        body with a Content-Length as some proxies reject chunked uploads
+    :param compress: gzip the body when it is large enough, chunks are
+        compressed as they are joined
+    :raise requests.exceptions.RequestException: on network errors and
+        non 2xx responses
+    """
+    if isinstance(data, str):
+        data = data.encode()
+    headers = dict(headers or {})
+    if not isinstance(data, bytes):
+        chunks = serializer.gzip_chunks(data) if compress else data
+        data = b''.join(chunks)
+        if compress:
+            headers['Content-Encoding'] = 'gzip'
+    elif compress and len(data) >= COMPRESS_MIN_BYTES:
+        data = gzip.compress(data, compresslevel=5)
+        headers['Content-Encoding'] = 'gzip'
+    response = get_session(pool_size, pool_hosts).post(
+        url, data=data, headers=headers, timeout=(connect_timeout, read_timeout),
+    )
+    response.raise_for_status()
+    return response
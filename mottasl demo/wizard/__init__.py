@@ -0,0 +1 @@
+from . import mottasl_event_replay
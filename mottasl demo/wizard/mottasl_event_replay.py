@@ -0,0 +1,40 @@
+from odoo import fields, models
+
+
+class MottaslEventReplay(models.TransientModel):
+    _name = 'mottasl.event.replay'
+    _description = 'Replay Mottasl Dead Letter Events'
+
+    name = fields.Char(string='Event', help="Only replay this event, e.g. invoice.create")
+    res_model = fields.Selection([
+        ('account.move', 'Invoice'),
+        ('sale.order', 'Sales Order'),
+        ('crm.lead', 'Lead'),
+    ], string='Model')
+    date_from = fields.Datetime(string='From')
+    date_to = fields.Datetime(string='To')
+
+    def _get_domain(self):
+        self.ensure_one()
+        domain = []
+        if self.name:
+            domain.append(('name', '=', self.name))
+        if self.res_model:
+            domain.append(('res_model', '=', self.res_model))
+        if self.date_from:
+            domain.append(('event_date', '>=', self.date_from))
+        if self.date_to:
+            domain.append(('event_date', '<=', self.date_to))
+        return domain
+
+    def action_replay(self):
+        count = self.env['mottasl.event.dead']._replay_domain(self._get_domain())
+        return {
+            'type': 'ir.actions.client',
+            'tag': 'display_notification',
+            'params': {
+                'type': 'success',
+                'message': f"{count} events queued for delivery.",
+                'next': {'type': 'ir.actions.act_window_close'},
+            },
+        }